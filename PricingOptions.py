@@ -1,13 +1,23 @@
 import xlwings as xw
 import numpy as np
-import pandas as pd
 import time
-from tqdm import tqdm
 from PythonFiles.tree import Tree
-from PythonFiles.greeks import Greeks
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.scenarios import spot_ladder
 from PythonFiles.utils import make_market_from_input, make_option_from_input, make_tree_from_input, calculate_prices_range, price_tree_memory
 from PythonFiles.visualisation import plot_price_convergence, plot_execution_time, plot_gap, plot_gap_step, plot_greek
 
+def write_report(wb, report) -> None:
+    '''
+    Écrit le rapport de construction de l'arbre (temps, noeuds, prunning, mémoire) et le nombre de noeuds par colonne dans la feuille "Build Report"
+    '''
+    if "Build Report" not in [sheet.name for sheet in wb.sheets]:
+        wb.sheets.add("Build Report")
+    sheet_report = wb.sheets["Build Report"]
+    sheet_report.clear_contents()
+    sheet_report.range('A1').value = [[name, value] for name, value in report.summary().items()]
+    sheet_report.range('D1').options(index=False).value = report.columns_frame()
+
 def main():
     '''
     Permet de calculer le prix de l'option avec arbre trinomial depuis python en prenant les paramètres excels
@@ -22,6 +32,7 @@ def main():
     mkt = make_market_from_input(sheet_pricer)
     option = make_option_from_input(sheet_pricer)
     tree = make_tree_from_input(sheet_pricer, mkt, option)
+    tree.instrument = True
 
     start=time.time()
     tree.generate_tree()
@@ -34,6 +45,7 @@ def main():
     sheet_pricer.range('IPythonPrice').value = tree.root_node.payoff
     sheet_pricer.range('IPythonTimeTree').value = generate_time
     sheet_pricer.range('IPythonPriceTime').value = price_time
+    write_report(wb, tree.report)
 
 @xw.sub
 def python_price():
@@ -50,6 +62,7 @@ def python_price():
     mkt = make_market_from_input(sheet_pricer)
     option = make_option_from_input(sheet_pricer)
     tree = make_tree_from_input(sheet_pricer, mkt, option)
+    tree.instrument = True
 
     start=time.time()
     tree.generate_tree()
@@ -62,6 +75,7 @@ def python_price():
     sheet_pricer.range('IPythonPrice').value = tree.root_node.payoff
     sheet_pricer.range('IPythonTimeTree').value = generate_time
     sheet_pricer.range('IPythonPriceTime').value = price_time
+    write_report(wb, tree.report)
 
 @xw.sub
 def python_tree_memory_price():
@@ -77,12 +91,6 @@ def python_tree_memory_price():
     # Initialisation des classes
     mkt = make_market_from_input(sheet_pricer)
     option = make_option_from_input(sheet_pricer)
-
-    if (mkt.dividende > 0): # Indisponible avec dividende pour l'instant
-        sheet_pricer.range('IPythonPriceTreeMemory').value = "N/A"
-        sheet_pricer.range('IPythonTimeTreeMemory').value = "N/A"
-        wb.app.api.Application.Run('MsgBox "Le pricing avec allocation de mémoire est indisponible avec dividende"')
-        return
     
     nb_steps: int = int(sheet_pricer.range('INbSteps').value)
     prunning : float = sheet_pricer.range('IPrunningTreshold').value
@@ -107,7 +115,8 @@ def generate_python_graphs():
     mkt = make_market_from_input(sheet_pricer)
     option = make_option_from_input(sheet_pricer)
     steps = sheet_conv.range('StepRange').options(np.ndarray).value
-    prices,execution_times = calculate_prices_range(steps, mkt, option)
+    prunning : float = sheet_pricer.range('IPrunningTreshold').value
+    prices,execution_times = calculate_prices_range(steps, mkt, option, prunning=prunning, engine=TreeVectorized)
 
     bs_price = option.compute_price(mkt)
     gap = bs_price - prices
@@ -135,19 +144,11 @@ def generate_greeks_graphs():
     sheet_pricer = wb.sheets["Interface"]
     sheet_greeks = wb.sheets["Greeks"]
     # Initialisation des classes
-    greeks = []
     opt = make_option_from_input(sheet_pricer)
+    mkt = make_market_from_input(sheet_pricer)
     spots = np.arange(int(opt.strike/2), int(opt.strike*1.5), 5)
-    for spot in tqdm(spots): # On calcule les grecs pour chaque spot
-        mkt = make_market_from_input(sheet_pricer, spot)
-        tree = Tree(opt, mkt, nb_steps = 100, prunning_value = 10^-7)
-        tree.generate_tree()
-        tree.price()
-        greek = Greeks(epsilon=0.01, tree=tree)
-        greek.compute_greeks()
-        greeks.append({'Delta':greek.delta, 'Gamma':greek.gamma, 'Vega':greek.vega, 'Theta':greek.theta,'Rho':greek.rho})
-    df_greeks = pd.DataFrame(greeks)
-    df_greeks['Spot'] = spots
+    # On calcule les grecs pour chaque spot en parallèle
+    df_greeks = spot_ladder(mkt, opt, spots, nb_steps = 100, prunning = 1e-7, greeks = True, engine = Tree)
     # Récupération des figures des grecks
     fig_delta = plot_greek(df_greeks, 'Delta', 'blue')
     fig_gamma = plot_greek(df_greeks, 'Gamma', 'green')
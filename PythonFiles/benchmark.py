@@ -0,0 +1,267 @@
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tracemalloc
+import multiprocessing
+from math import exp
+from datetime import datetime, date, timedelta
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+from PythonFiles.market import Market, Dividend
+from PythonFiles.options import Option, EuropeanCallOption, AmericanPutOption, BermudeanPutOption, DigitalCallOption
+from PythonFiles.blackScholes import compute_d2
+from PythonFiles.tree import Tree
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.treeMemoryAlloc import TreeMemoryAlloc
+
+#Moteurs et produits de la suite de benchmark (un nouveau moteur s'ajoute ici)
+ENGINES = {"Tree" : Tree, "TreeVectorized" : TreeVectorized, "TreeMemoryAlloc" : TreeMemoryAlloc}
+PRODUCTS = ("european-call", "american-put", "bermudan-put", "digital-call")
+#Date de départ fixe : les pas du dividende et des dates d'exercice sont identiques d'un run à l'autre
+START_DATE = date(2024, 1, 2)
+
+def count_nodes(tree) -> int:
+    '''
+    Compte le nombre de noeuds d'un arbre généré (Tree, TreeVectorized ou TreeMemoryAlloc)
+    '''
+    return sum(tree.column_sizes())
+
+def memory_per_node(market : Market, option : Option, nb_steps : int, prunning : float) -> pd.DataFrame:
+    '''
+    Mesure (tracemalloc) la mémoire allouée pour générer l'arbre avec chaque représentation des noeuds
+    '''
+    representations = {
+        "Node (dataclass)" : lambda: Tree(option=option, market=market, nb_steps=nb_steps, prunning_value=prunning),
+        "CompactNode (slots)" : lambda: Tree(option=option, market=market, nb_steps=nb_steps, prunning_value=prunning, compact_nodes=True),
+        "Columns float64" : lambda: TreeVectorized(option=option, market=market, nb_steps=nb_steps, prunning_value=prunning),
+        "Columns float32" : lambda: TreeVectorized(option=option, market=market, nb_steps=nb_steps, prunning_value=prunning, precision="float32"),
+    }
+    results = []
+    for name, make_tree in representations.items():
+        tree = make_tree()
+        tracemalloc.start()
+        tree.generate_tree()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        nb_nodes = count_nodes(tree)
+        results.append({"Representation" : name, "Nodes" : nb_nodes, "Memory (MB)" : current / 1e6, "Peak (MB)" : peak / 1e6, "Bytes per node" : current / nb_nodes})
+        del tree
+    return pd.DataFrame(results)
+
+def backward_scaling(market : Market, option : Option, steps : list[int], prunning : float, engine : type[Tree] = Tree) -> tuple[pd.DataFrame, float]:
+    '''
+    Temps de la rétropropagation seule en fonction du nombre de pas. Renvoie le tableau des temps et l'exposant de la régression
+    log(temps) ~ log(noeuds), qui doit rester proche de 1 y compris pour les américaines : coût en O(N²) sans prunning (N² noeuds)
+    '''
+    results = []
+    for nb_steps in steps:
+        tree = engine(option=option, market=market, nb_steps=nb_steps, prunning_value=prunning)
+        tree.generate_tree()
+        start = time.perf_counter()
+        tree.price()
+        timer_price = time.perf_counter() - start
+        results.append({"Steps" : nb_steps, "Nodes" : count_nodes(tree), "Time Price" : timer_price, "Time / node (µs)" : 1e6 * timer_price / count_nodes(tree)})
+    df = pd.DataFrame(results)
+    exponent = np.polyfit(np.log(df["Nodes"]), np.log(df["Time Price"]), 1)[0]
+    return df, exponent
+
+def make_market(with_dividend : bool) -> Market:
+    '''
+    Marché de la suite : dividende de 3 détaché à 6 mois ou pas de dividende
+    '''
+    if with_dividend:
+        return Market(spot=100, volatility=0.2, rate=0.05, dividende=3, div_date=START_DATE + timedelta(days=182))
+    return Market(spot=100, volatility=0.2, rate=0.05)
+
+def make_option(product : str) -> Option:
+    '''
+    Produit de la suite, à la monnaie et de maturité 1 an
+    '''
+    match product:
+        case "european-call":
+            return EuropeanCallOption(strike=100, time_to_maturity=1, start_date=START_DATE)
+        case "american-put":
+            return AmericanPutOption(strike=100, time_to_maturity=1, start_date=START_DATE)
+        case "bermudan-put":
+            return BermudeanPutOption(strike=100, time_to_maturity=1, start_date=START_DATE, exercise_dates=[START_DATE + timedelta(days=days) for days in (91, 182, 273)])
+        case "digital-call":
+            return DigitalCallOption(strike=100, time_to_maturity=1, start_date=START_DATE)
+
+def reference_price(product : str, with_dividend : bool, reference_steps : int) -> tuple[float, str]:
+    '''
+    Prix de référence : formule fermée pour le call et la digitale européens sans dividende, sinon arbre en flux
+    (TreeMemoryAlloc lissé) extrapolé par Richardson sur reference_steps et 2 * reference_steps pas
+    '''
+    market, option = make_market(with_dividend), make_option(product)
+    if not with_dividend and product == "european-call":
+        return option.compute_price(market), "Closed form"
+    if not with_dividend and product == "digital-call":
+        d_2 = compute_d2(market.spot, option.strike, option.time_to_maturity, market.volatility, market.rate)
+        return option.coupon * exp(-market.rate * option.time_to_maturity) * float(ndtr(d_2)), "Closed form"
+    tree = TreeMemoryAlloc(option=option, market=market, nb_steps=reference_steps, prunning_value=1e-12, smoothing=True)
+    return tree.price_richardson()["Price"], f"Richardson {reference_steps}/{2 * reference_steps} steps"
+
+def quarterly_dividends(years : int, amount : float = 1.0, proportional : float = 0.0) -> list[Dividend]:
+    '''
+    Calendrier trimestriel de dividendes (cash et/ou proportionnels) sur years années à partir de START_DATE
+    '''
+    return [Dividend(date=START_DATE + timedelta(days=91 * quarter), amount=amount, proportional=proportional) for quarter in range(1, 4 * years + 1)]
+
+def dividend_scaling(engines : list[str], nb_steps : int, maturities : list[int], prunning : float) -> pd.DataFrame:
+    '''
+    Temps de génération et nombre de noeuds avec des dividendes trimestriels (cash puis proportionnels) comparés au marché sans dividende :
+    le recentrage à chaque détachement doit garder la grille quasi recombinante (ratios proches de 1)
+    '''
+    schedules = {"None" : [], "Quarterly cash" : None, "Quarterly proportional" : None}
+    results = []
+    for maturity in maturities:
+        schedules["Quarterly cash"] = quarterly_dividends(maturity, amount=1.0)
+        schedules["Quarterly proportional"] = quarterly_dividends(maturity, amount=0.0, proportional=0.01)
+        option = AmericanPutOption(strike=100, time_to_maturity=maturity, start_date=START_DATE)
+        for engine in engines:
+            for schedule, dividends in schedules.items():
+                tree = ENGINES[engine](option=option, market=Market(spot=100, volatility=0.2, rate=0.05, dividends=dividends), nb_steps=nb_steps, prunning_value=prunning)
+                start = time.perf_counter()
+                tree.generate_tree()
+                timer_generate = time.perf_counter() - start
+                results.append({"Engine" : engine, "Maturity" : maturity, "Dividends" : schedule, "Nb Dividends" : len(dividends),
+                                "Time Generate" : timer_generate, "Nodes" : count_nodes(tree), "Price" : tree.price()})
+    df = pd.DataFrame(results)
+    baseline = df[df["Dividends"] == "None"].set_index(["Engine", "Maturity"])
+    keys = pd.MultiIndex.from_frame(df[["Engine", "Maturity"]])
+    df["Time Ratio"] = df["Time Generate"].to_numpy() / baseline["Time Generate"].reindex(keys).to_numpy()
+    df["Nodes Ratio"] = df["Nodes"].to_numpy() / baseline["Nodes"].reindex(keys).to_numpy()
+    return df
+
+def peak_rss() -> float:
+    '''
+    Pic de mémoire résidente du process en MB (ru_maxrss est en ko sous Linux, en octets sous macOS)
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+def run_case(case : dict) -> dict:
+    '''
+    Génère et price un cas de la suite. Exécuté dans un process neuf pour que le pic de RSS soit propre au cas
+    '''
+    tree = ENGINES[case["Engine"]](option=make_option(case["Product"]), market=make_market(case["Dividend"]),
+                                   nb_steps=case["Steps"], prunning_value=case["Prunning"])
+    start = time.perf_counter()
+    tree.generate_tree()
+    timer_generate = time.perf_counter() - start
+    start = time.perf_counter()
+    price = tree.price()
+    timer_price = time.perf_counter() - start
+    return {**case, "Price" : price, "Time Generate" : timer_generate, "Time Price" : timer_price, "Wall Time" : timer_generate + timer_price,
+            "Nodes" : count_nodes(tree), "Peak RSS (MB)" : peak_rss()}
+
+def run_suite(engines : list[str] = tuple(ENGINES), steps : list[int] = (100, 1000, 5000, 20000), prunnings : list[float] = (1e-8, 1e-10),
+              products : list[str] = PRODUCTS, dividends : list[bool] = (False, True), reference_steps : int = 20000,
+              max_tree_steps : int = 5000) -> dict:
+    '''
+    Exécute la matrice moteurs x pas x prunning x produits x marchés, chaque cas dans un process séparé (séquentiellement, pour ne pas fausser les temps).
+    Tree (un objet par noeud) n'est lancé que jusqu'à max_tree_steps pas
+    '''
+    references = {(product, dividend) : reference_price(product, dividend, reference_steps) for product in products for dividend in dividends}
+    cases = [{"Engine" : engine, "Steps" : int(nb_steps), "Prunning" : prunning, "Product" : product, "Dividend" : dividend}
+             for engine in engines for nb_steps in steps for prunning in prunnings for product in products for dividend in dividends
+             if engine != "Tree" or nb_steps <= max_tree_steps]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"), max_tasks_per_child=1) as executor:
+        for result in executor.map(run_case, cases):
+            reference, source = references[(result["Product"], result["Dividend"])]
+            result.update({"Reference" : reference, "Reference Source" : source, "Error" : result["Price"] - reference})
+            results.append(result)
+            print(f"{result['Engine']:>16} {result['Product']:>14} div={result['Dividend']!s:5} N={result['Steps']:>6} prunning={result['Prunning']:.0e} "
+                  f"{result['Wall Time']:8.3f}s {result['Nodes']:>10} noeuds {result['Peak RSS (MB)']:8.1f} MB erreur {result['Error']:+.2e}")
+
+    metadata = {"Date" : datetime.now().isoformat(timespec="seconds"), "Python" : platform.python_version(), "Machine" : platform.platform(),
+                "NumPy" : np.__version__, "Reference Steps" : reference_steps}
+    return {"Metadata" : metadata, "Results" : results}
+
+def compare_runs(baseline : dict, current : dict, time_tolerance : float = 0.25, min_time : float = 0.005, error_tolerance : float = 1e-6) -> pd.DataFrame:
+    '''
+    Compare deux runs cas par cas. Signale une régression de temps si le temps augmente de plus de time_tolerance (relatif)
+    et de plus de min_time secondes (bruit de mesure), une régression de précision si l'erreur augmente de plus de error_tolerance
+    '''
+    keys = ["Engine", "Steps", "Prunning", "Product", "Dividend"]
+    columns = keys + ["Wall Time", "Error", "Nodes", "Peak RSS (MB)"]
+    merged = pd.DataFrame(baseline["Results"])[columns].merge(pd.DataFrame(current["Results"])[columns], on=keys, suffixes=(" Baseline", " Current"))
+    merged["Time Ratio"] = merged["Wall Time Current"] / merged["Wall Time Baseline"]
+    merged["Time Regression"] = (merged["Time Ratio"] > 1 + time_tolerance) & (merged["Wall Time Current"] - merged["Wall Time Baseline"] > min_time)
+    merged["Error Regression"] = merged["Error Current"].abs() > merged["Error Baseline"].abs() + error_tolerance
+    merged["Nodes Changed"] = merged["Nodes Current"] != merged["Nodes Baseline"]
+    return merged
+
+def main(argv : list[str] = None) -> int:
+    '''
+    Point d'entrée en ligne de commande : python -m PythonFiles.benchmark {run, compare, memory, dividends}
+    '''
+    parser = argparse.ArgumentParser(prog="python -m PythonFiles.benchmark", description="Benchmarks des moteurs de l'arbre trinomial")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Exécute la suite et écrit les résultats en JSON")
+    run.add_argument("--output", default="benchmark.json")
+    run.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    run.add_argument("--steps", nargs="+", type=int, default=[100, 1000, 5000, 20000])
+    run.add_argument("--prunnings", nargs="+", type=float, default=[1e-8, 1e-10])
+    run.add_argument("--products", nargs="+", default=list(PRODUCTS), choices=list(PRODUCTS))
+    run.add_argument("--markets", nargs="+", default=["no-div", "div"], choices=["no-div", "div"])
+    run.add_argument("--reference-steps", type=int, default=20000)
+    run.add_argument("--max-tree-steps", type=int, default=5000)
+
+    compare = commands.add_parser("compare", help="Compare deux runs et signale les régressions")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--time-tolerance", type=float, default=0.25)
+    compare.add_argument("--error-tolerance", type=float, default=1e-6)
+
+    commands.add_parser("memory", help="Mémoire par noeud et coût de la rétropropagation américaine")
+
+    dividends = commands.add_parser("dividends", help="Coût de génération avec des dividendes trimestriels par rapport au marché sans dividende")
+    dividends.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    dividends.add_argument("--steps", type=int, default=1000)
+    dividends.add_argument("--maturities", nargs="+", type=int, default=[1, 3, 5])
+    dividends.add_argument("--prunning", type=float, default=1e-10)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        suite = run_suite(args.engines, args.steps, args.prunnings, args.products, [market == "div" for market in args.markets],
+                          args.reference_steps, args.max_tree_steps)
+        with open(args.output, "w") as file:
+            json.dump(suite, file, indent=2)
+        print(f"{len(suite['Results'])} cas écrits dans {args.output}")
+        return 0
+
+    if args.command == "compare":
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.current) as file:
+            current = json.load(file)
+        df = compare_runs(baseline, current, args.time_tolerance, error_tolerance=args.error_tolerance)
+        print(df.to_string(index=False))
+        regressions = df[df["Time Regression"] | df["Error Regression"]]
+        print(f"{len(regressions)} régression(s) sur {len(df)} cas comparés")
+        return 1 if len(regressions) > 0 else 0
+
+    if args.command == "dividends":
+        print(dividend_scaling(args.engines, args.steps, args.maturities, args.prunning).to_string(index=False))
+        return 0
+
+    market = Market(spot=100, volatility=0.2, rate=0.05)
+    option = AmericanPutOption(strike=100, time_to_maturity=1, start_date=datetime.today())
+    print(memory_per_node(market, option, nb_steps=2000, prunning=1e-10).to_string(index=False))
+    for prunning in (1e-10, 0):
+        df, exponent = backward_scaling(market, option, steps=[250, 500, 1000, 2000], prunning=prunning)
+        print(df.to_string(index=False))
+        print(f"Prunning {prunning} : exposant temps / noeuds de la rétropropagation américaine {exponent:.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
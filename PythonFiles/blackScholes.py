@@ -0,0 +1,82 @@
+import numpy as np
+from scipy.special import ndtr
+
+#Formules fermées de Black-Scholes vectorisées : chaque paramètre peut être un float ou un tableau numpy (broadcasting).
+#Le dividende est un montant retranché du spot, comme dans Option.d1
+
+def compute_d1(spot, strike, maturity, volatility, rate, dividende = 0):
+    spot_adjusted = np.asarray(spot, dtype=float) - dividende
+    return (np.log(spot_adjusted / strike) + maturity * (rate + volatility ** 2 / 2)) / (volatility * np.sqrt(maturity))
+
+def compute_d2(spot, strike, maturity, volatility, rate, dividende = 0):
+    return compute_d1(spot, strike, maturity, volatility, rate, dividende) - volatility * np.sqrt(maturity)
+
+def black_scholes_price(spot, strike, maturity, volatility, rate, dividende = 0, is_call = True) -> np.ndarray:
+    '''
+    Prix des calls (is_call vrai) et des puts européens
+    '''
+    spot_adjusted = np.asarray(spot, dtype=float) - dividende
+    d_1 = compute_d1(spot, strike, maturity, volatility, rate, dividende)
+    d_2 = d_1 - volatility * np.sqrt(maturity)
+    discounted_strike = strike * np.exp(-rate * maturity)
+    call = spot_adjusted * ndtr(d_1) - discounted_strike * ndtr(d_2)
+    put = -spot_adjusted * ndtr(-d_1) + discounted_strike * ndtr(-d_2)
+    return np.where(is_call, call, put)
+
+def digital_price(spot, strike, maturity, volatility, rate, dividende = 0, is_call = True, coupon = 1) -> np.ndarray:
+    '''
+    Prix des digitales cash-or-nothing européennes : coupon actualisé fois la probabilité risque-neutre de finir dans la monnaie, N(±d2)
+    '''
+    d_2 = compute_d2(spot, strike, maturity, volatility, rate, dividende)
+    return coupon * np.exp(-rate * maturity) * ndtr(np.where(is_call, d_2, -d_2))
+
+def black_scholes_greeks(spot, strike, maturity, volatility, rate, dividende = 0, is_call = True) -> dict:
+    '''
+    Prix et grecs analytiques en une passe (theta par année calendaire écoulée, mêmes conventions que Greeks)
+    '''
+    spot_adjusted = np.asarray(spot, dtype=float) - dividende
+    sqrt_maturity = np.sqrt(maturity)
+    d_1 = compute_d1(spot, strike, maturity, volatility, rate, dividende)
+    d_2 = d_1 - volatility * sqrt_maturity
+    density = np.exp(-d_1 ** 2 / 2) / np.sqrt(2 * np.pi)
+    discounted_strike = strike * np.exp(-rate * maturity)
+    sign = np.where(is_call, 1.0, -1.0)
+
+    cdf_1, cdf_2 = ndtr(sign * d_1), ndtr(sign * d_2)
+    price = sign * (spot_adjusted * cdf_1 - discounted_strike * cdf_2)
+    return {
+        "Price" : price,
+        "Delta" : sign * cdf_1,
+        "Gamma" : density / (spot_adjusted * volatility * sqrt_maturity),
+        "Vega" : spot_adjusted * density * sqrt_maturity,
+        "Theta" : -spot_adjusted * density * volatility / (2 * sqrt_maturity) - sign * rate * discounted_strike * cdf_2,
+        "Rho" : sign * maturity * discounted_strike * cdf_2,
+    }
+
+def barrier_out_price(spot, strike, barrier, maturity, volatility, rate, is_call = True, is_up = True) -> np.ndarray:
+    '''
+    Prix des options knock-out européennes à barrière observée en continu (Reiner-Rubinstein, sans rebate ni dividende),
+    nul si le spot a déjà franchi la barrière. Le knock-in s'obtient par parité : vanille - knock-out
+    '''
+    spot = np.asarray(spot, dtype=float)
+    phi, eta = np.where(is_call, 1.0, -1.0), np.where(is_up, -1.0, 1.0)
+    std = volatility * np.sqrt(maturity)
+    mu = (rate - volatility ** 2 / 2) / volatility ** 2
+    discounted_strike = strike * np.exp(-rate * maturity)
+    ratio = barrier / spot
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_1 = np.log(spot / strike) / std + (1 + mu) * std
+        x_2 = np.log(spot / barrier) / std + (1 + mu) * std
+        y_1 = np.log(barrier ** 2 / (spot * strike)) / std + (1 + mu) * std
+        y_2 = np.log(barrier / spot) / std + (1 + mu) * std
+        a = phi * spot * ndtr(phi * x_1) - phi * discounted_strike * ndtr(phi * (x_1 - std))
+        b = phi * spot * ndtr(phi * x_2) - phi * discounted_strike * ndtr(phi * (x_2 - std))
+        c = phi * spot * ratio ** (2 * (mu + 1)) * ndtr(eta * y_1) - phi * discounted_strike * ratio ** (2 * mu) * ndtr(eta * (y_1 - std))
+        d = phi * spot * ratio ** (2 * (mu + 1)) * ndtr(eta * y_2) - phi * discounted_strike * ratio ** (2 * mu) * ndtr(eta * (y_2 - std))
+    strike_above = np.asarray(strike > barrier)
+    #Call down-and-out et put up-and-out ont la même structure (strike du côté opposé à la barrière), de même pour les deux autres
+    same_side = np.where(is_call, np.logical_not(is_up), is_up)
+    away = np.where(is_call, strike_above, np.logical_not(strike_above))
+    price = np.where(same_side, np.where(away, a - c, b - d), np.where(away, 0.0, a - b + c - d))
+    breached = np.where(is_up, spot >= barrier, spot <= barrier)
+    return np.where(breached, 0.0, np.maximum(price, 0.0))
@@ -1,85 +1,132 @@
-from PythonFiles.options import EuropeanCallOption
+from dataclasses import dataclass, replace
 from PythonFiles.market import Market
 from PythonFiles.tree import Tree
-from dataclasses import dataclass
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.treeMemoryAlloc import TreeMemoryAlloc
+from PythonFiles.priceCache import PriceCache, cache_key
 
 @dataclass
 class Greeks:
 
     tree : Tree
     epsilon : float = 0.01
+    from_lattice : bool = False
+    cache : PriceCache = None
 
     delta : float = 0
     gamma : float = 0
-    vega : float = 0 
+    vega : float = 0
     theta : float = 0
     rho : float = 0
 
     def compute_greeks(self) -> None:
-        self.tree.generate_tree()
-        self.tree.price()
-        self.price_tree = self.tree.root_node.payoff
-
-        self.compute_delta()
+        '''
+        Calcule les grecs. Avec from_lattice, delta/gamma/theta sont lus sur l'arbre de base : seuls vega et rho demandent un nouvel arbre.
+        L'arbre de base n'est régénéré que si ses entrées ont changé depuis sa construction (voir Tree.refresh_tree)
+        '''
+        self.tree.refresh_tree()
+        self.price_tree = self.tree.price()
+
+        #TreeMemoryAlloc ne garde pas les colonnes : on revient aux chocs
+        if self.from_lattice and self.tree.nb_steps >= 2 and not isinstance(self.tree, TreeMemoryAlloc):
+            self.compute_lattice_greeks()
+        else:
+            self.compute_delta()
+            self.compute_gamma()
+            self.compute_theta()
         self.compute_vega()
-        self.compute_gamma()
-        self.compute_theta()
         self.compute_rho()
 
+    def _bumped_price(self, market : Market) -> float:
+        '''
+        Price sur un nouvel arbre avec le marché choqué (les cached_property de l'arbre de base ne sont pas valables pour un autre marché),
+        en reprenant les attributs qui ne dépendent que de l'option et du nombre de pas. Avec un cache, un choc déjà pricé n'est pas reconstruit
+        '''
+        if self.cache is not None:
+            key = cache_key(market, self.tree.option, self.tree.nb_steps, self.tree.prunning_value, engine=type(self.tree), smoothing=self.tree.smoothing, price_tolerance=self.tree.price_tolerance, barrier_alignment=self.tree.barrier_alignment)
+            price = self.cache.get(key)
+            if price is not None:
+                return price
+        tree = replace(self.tree, market=market)
+        for name in ("time_delta", "dividend_steps", "exercise_steps", "exercise_mask"):
+            if name in self.tree.__dict__:
+                tree.__dict__[name] = self.tree.__dict__[name]
+        if (market.volatility, market.vol_curve) == (self.tree.market.volatility, self.tree.market.vol_curve) and "alpha" in self.tree.__dict__:
+            tree.__dict__["alpha"] = self.tree.alpha
+        tree.generate_tree()
+        price = tree.price()
+        if self.cache is not None:
+            self.cache.put(key, price)
+        return price
+
+    def _trunk_neighbours(self, step : int) -> tuple[list[float], list[float]]:
+        '''
+        Prix et payoffs des noeuds (down, mid, up) autour du tronc à un timeStep donné de l'arbre de base
+        '''
+        if isinstance(self.tree, TreeVectorized):
+            column = self.tree.columns[step]
+            around = slice(column.trunk - 1, column.trunk + 2)
+            return column.prices[around].tolist(), column.payoff[around].tolist()
+        trunk_node = self.tree.root_node
+        for _ in range(step):
+            trunk_node = trunk_node.next_mid
+        nodes = [trunk_node.down_node, trunk_node, trunk_node.up_node]
+        return [node.price for node in nodes], [node.payoff for node in nodes]
+
+    def compute_lattice_greeks(self):
+        '''
+        Delta et gamma par différences finies entre les noeuds du timeStep 1, theta sur le tronc au timeStep 2
+        '''
+        (s_down, s_mid, s_up), (v_down, v_mid, v_up) = self._trunk_neighbours(1)
+        self.delta = (v_up - v_down) / (s_up - s_down)
+        self.gamma = 2 * ((v_up - v_mid) / (s_up - s_mid) - (v_mid - v_down) / (s_mid - s_down)) / (s_up - s_down)
+
+        #Le tronc suit le forward : on interpole (Lagrange ordre 2) la valeur au timeStep 2 au niveau du spot initial
+        prices, payoffs = self._trunk_neighbours(2)
+        spot = self.tree.market.spot
+        value = 0
+        for i, (price_i, payoff_i) in enumerate(zip(prices, payoffs)):
+            weight = 1
+            for j, price_j in enumerate(prices):
+                if j != i:
+                    weight *= (spot - price_j) / (price_i - price_j)
+            value += weight * payoff_i
+        self.theta = (value - self.price_tree) / (2 * self.tree.time_delta)
+
     def compute_delta(self):
 
         delta_s = self.epsilon * 100
 
-        self.tree.market.spot += delta_s
-        self.tree.generate_tree()
-        self.tree.price()
-
-        self.delta = (self.tree.root_node.payoff - self.price_tree)/(delta_s)
-        self.tree.market.spot -= delta_s
+        price_up = self._bumped_price(replace(self.tree.market, spot=self.tree.market.spot + delta_s))
+        self.delta = (price_up - self.price_tree)/(delta_s)
 
     def compute_vega(self):
         delta_v = self.epsilon
 
-        self.tree.market.volatility += delta_v 
-        self.tree.generate_tree()
-        self.tree.price()
+        price_up = self._bumped_price(self.tree.market.shifted(volatility=delta_v))
+        self.vega = (price_up - self.price_tree)/(delta_v)
 
-        self.vega = (self.tree.root_node.payoff - self.price_tree)/(delta_v)
-        self.tree.market.volatility -= delta_v
-        
     def compute_gamma(self):
         delta_g = self.epsilon * 500
 
-        self.tree.market.spot += delta_g
-        self.tree.generate_tree()
-        self.tree.price()
-        price_up = self.tree.root_node.payoff
-
-        self.tree.market.spot -= 2*delta_g
-        self.tree.generate_tree()
-        self.tree.price()
-        price_down = self.tree.root_node.payoff
+        price_up = self._bumped_price(replace(self.tree.market, spot=self.tree.market.spot + delta_g))
+        price_down = self._bumped_price(replace(self.tree.market, spot=self.tree.market.spot - delta_g))
 
         self.gamma = (price_up - 2*self.price_tree + price_down)/(delta_g)**2
-        self.tree.market.spot += delta_g
 
     def compute_theta(self):
         delta_t = 5 * self.epsilon
 
         self.tree.option.time_to_maturity -= delta_t
-        tree_bis = Tree(option=self.tree.option, market=self.tree.market, nb_steps=self.tree.nb_steps, prunning_value=self.tree.prunning_value)
+        tree_bis = replace(self.tree)
         tree_bis.generate_tree()
-        tree_bis.price()
+        price_bis = tree_bis.price()
 
-        self.theta = (tree_bis.root_node.payoff - self.price_tree)/(delta_t)
+        self.theta = (price_bis - self.price_tree)/(delta_t)
         self.tree.option.time_to_maturity += delta_t
 
     def compute_rho(self):
         delta_r = self.epsilon
 
-        self.tree.market.rate += delta_r
-        self.tree.generate_tree()
-        self.tree.price()
-
-        self.rho = (self.tree.root_node.payoff - self.price_tree)/(delta_r)
-        self.tree.market.rate -= delta_r
\ No newline at end of file
+        price_up = self._bumped_price(self.tree.market.shifted(rate=delta_r))
+        self.rho = (price_up - self.price_tree)/(delta_r)
@@ -0,0 +1,94 @@
+import os
+from math import ceil, isfinite
+from dataclasses import replace
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.optimize import brentq
+from PythonFiles.market import Market
+from PythonFiles.options import Option, CallOption, PutOption
+from PythonFiles.blackScholes import black_scholes_price, black_scholes_greeks
+from PythonFiles.tree import Tree
+from PythonFiles.treeVectorized import TreeVectorized
+
+MIN_VOLATILITY = 1e-4
+MAX_VOLATILITY = 5.0
+
+def black_scholes_implied_vol(price : float, market : Market, option : Option) -> float:
+    '''
+    Volatilité implicite Black-Scholes de l'européenne de même strike (None si le prix est hors des bornes de la formule)
+    '''
+    if not isinstance(option, (CallOption, PutOption)):
+        return None
+    is_call = isinstance(option, CallOption)
+    rate, _ = market.flat_parameters(option.time_to_maturity)
+    objective = lambda volatility: float(black_scholes_price(market.spot, option.strike, option.time_to_maturity, volatility, rate, market.dividende, is_call)) - price
+    if objective(MIN_VOLATILITY) * objective(MAX_VOLATILITY) > 0:
+        return None
+    return brentq(objective, MIN_VOLATILITY, MAX_VOLATILITY)
+
+def tree_price(market : Market, option : Option, volatility : float, nb_steps : int, prunning : float, engine : type[Tree] = TreeVectorized) -> float:
+    '''
+    Prix de l'arbre pour une volatilité donnée
+    '''
+    tree = engine(option=option, market=replace(market, volatility=volatility), nb_steps=nb_steps, prunning_value=prunning)
+    tree.generate_tree()
+    return tree.price()
+
+def implied_volatility(price : float, market : Market, option : Option, nb_steps : int, prunning : float, engine : type[Tree] = TreeVectorized,
+                       tolerance : float = 1e-6, max_iterations : int = 20) -> float:
+    '''
+    Volatilité implicite de l'arbre (américaines, bermudéennes...) par méthode de Newton :
+    départ à la volatilité implicite Black-Scholes, première pente donnée par le vega Black-Scholes puis par la sécante
+    entre les deux derniers arbres pricés (pas d'arbre choqué). Repli sur Brent si la pente n'est pas exploitable.
+    Un seul arbre sert à toutes les itérations : seuls les attributs qui dépendent de la volatilité sont recalculés (voir Tree.refresh_tree)
+    '''
+    if market.local_vol is not None:
+        raise ValueError("Volatilité implicite impossible avec une surface de volatilité locale : l'arbre ignore market.volatility")
+    rate, flat_volatility = market.flat_parameters(option.time_to_maturity)
+    #La volatilité implicite est plate : la structure par terme éventuelle est remplacée par la volatilité testée
+    tree = engine(option=option, market=replace(market, vol_curve=None), nb_steps=nb_steps, prunning_value=prunning)
+
+    def objective(volatility : float) -> float:
+        tree.market.volatility = volatility
+        return tree.reprice() - price
+
+    volatility = black_scholes_implied_vol(price, market, option)
+    if volatility is None:
+        volatility = flat_volatility
+    if isinstance(option, (CallOption, PutOption)):
+        slope = float(black_scholes_greeks(market.spot, option.strike, option.time_to_maturity, volatility, rate, market.dividende, isinstance(option, CallOption))["Vega"])
+    else:
+        slope = None
+
+    previous = None
+    for _ in range(max_iterations):
+        error = objective(volatility)
+        if abs(error) < tolerance:
+            return volatility
+        if previous is not None and volatility != previous[0]:
+            slope = (error - previous[1]) / (volatility - previous[0])
+        if slope is None or not isfinite(slope) or slope <= 0:
+            break
+        previous = (volatility, error)
+        volatility = min(max(volatility - error / slope, MIN_VOLATILITY), MAX_VOLATILITY)
+
+    if objective(MIN_VOLATILITY) * objective(MAX_VOLATILITY) > 0:
+        return np.nan
+    return brentq(objective, MIN_VOLATILITY, MAX_VOLATILITY, xtol=tolerance)
+
+def _implied_volatility_job(arguments : tuple) -> float:
+    return implied_volatility(*arguments)
+
+def implied_volatility_chain(market : Market, options : list[Option], prices : list[float], nb_steps : int, prunning : float,
+                             engine : type[Tree] = TreeVectorized, max_workers : int = None, chunksize : int = None) -> np.ndarray:
+    '''
+    Volatilités implicites d'une chaîne d'options, chaque cotation étant inversée dans un process du pool
+    '''
+    jobs = [(price, market, option, nb_steps, prunning, engine) for option, price in zip(options, prices)]
+    max_workers = max_workers or os.cpu_count()
+    if max_workers == 1 or len(jobs) <= 1:
+        return np.array([_implied_volatility_job(job) for job in jobs])
+    if chunksize is None:
+        chunksize = max(1, ceil(len(jobs) / (4 * max_workers)))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return np.array(list(executor.map(_implied_volatility_job, jobs, chunksize=chunksize)))
@@ -0,0 +1,85 @@
+import time
+import tracemalloc
+from functools import wraps
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import pandas as pd
+
+@dataclass
+class TreeReport:
+    '''
+    Statistiques de construction et de pricing d'un arbre, remplies seulement si l'arbre est instrumenté (instrument=True)
+    '''
+    engine : str
+    nb_steps : int
+    prunning_value : float = None
+    #tracemalloc ralentit fortement la génération de Tree (une allocation par noeud) : le pic mémoire est optionnel
+    track_memory : bool = False
+
+    timings : dict = field(default_factory=dict)
+    nodes_per_column : list[int] = field(default_factory=list)
+    pruned_nodes : int = 0
+    find_mid_searches : int = 0
+    peak_memory : dict = field(default_factory=dict)
+
+    @contextmanager
+    def phase(self, name : str):
+        '''
+        Mesure le temps et, si track_memory, le pic de mémoire (tracemalloc) d'une phase ("Generate", "Price")
+        '''
+        started_tracing = self.track_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.timings[name] = time.perf_counter() - start
+            if self.track_memory:
+                self.peak_memory[name] = tracemalloc.get_traced_memory()[1] - start_memory
+            if started_tracing:
+                tracemalloc.stop()
+
+    def summary(self) -> dict:
+        '''
+        Rapport à plat (une valeur par clé) pour l'affichage dans l'app Streamlit ou Excel
+        '''
+        summary = {"Engine" : self.engine, "Steps" : self.nb_steps, "Prunning" : self.prunning_value}
+        for name, timer in self.timings.items():
+            summary[f"Time {name}"] = timer
+        summary["Nodes"] = sum(self.nodes_per_column)
+        summary["Max Column Size"] = max(self.nodes_per_column, default=0)
+        summary["Pruned Nodes"] = self.pruned_nodes
+        summary["Find Mid Searches"] = self.find_mid_searches
+        for name, peak in self.peak_memory.items():
+            summary[f"Peak Memory {name} (MB)"] = peak / 1e6
+        return summary
+
+    def columns_frame(self) -> pd.DataFrame:
+        '''
+        Nombre de noeuds par colonne (timeStep)
+        '''
+        return pd.DataFrame({"Step" : range(len(self.nodes_per_column)), "Nodes" : self.nodes_per_column})
+
+def instrumented(phase : str):
+    '''
+    Décorateur des méthodes generate_tree et price des arbres : sans instrumentation la méthode est appelée telle quelle,
+    sinon la phase est chronométrée et la génération ouvre un nouveau rapport (tree.report)
+    '''
+    def decorator(method):
+        @wraps(method)
+        def wrapper(tree, *args, **kwargs):
+            if not tree.instrument:
+                return method(tree, *args, **kwargs)
+            if phase == "Generate" or tree.report is None:
+                tree.report = TreeReport(engine=type(tree).__name__, nb_steps=tree.nb_steps, prunning_value=tree.prunning_value, track_memory=tree.instrument_memory)
+            with tree.report.phase(phase):
+                result = method(tree, *args, **kwargs)
+            if phase == "Generate":
+                tree.report.nodes_per_column = tree.column_sizes()
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,59 @@
+from datetime import datetime
+from dataclasses import dataclass, replace
+from functools import cached_property
+import numpy as np
+from PythonFiles.market import Market
+from PythonFiles.options import Option, EuropeanCallOption
+from PythonFiles.treeVectorized import TreeVectorized
+
+@dataclass
+class Lattice:
+    '''
+    Géométrie de l'arbre (prix, probabilités de transition, recentrage au dividende) pour un marché, une maturité et un nombre de pas.
+    Construite une seule fois puis partagée en lecture seule : chaque option pricée dessus ne coûte que sa rétropropagation
+    '''
+    market : Market
+    time_to_maturity : float
+    start_date : datetime
+    nb_steps : int
+    prunning_value : float = 1e-10
+    precision : str = "float64"
+
+    @classmethod
+    def from_option(cls, market : Market, option : Option, nb_steps : int, prunning_value : float = 1e-10) -> "Lattice":
+        '''
+        Grille de même maturité et même date de départ que l'option
+        '''
+        return cls(market=market, time_to_maturity=option.time_to_maturity, start_date=option.start_date, nb_steps=nb_steps, prunning_value=prunning_value)
+
+    @cached_property
+    def tree(self) -> TreeVectorized:
+        '''
+        Arbre vectorisé généré une fois. L'option ne porte que la maturité et la date de départ (la géométrie ne dépend pas du payoff)
+        '''
+        template = EuropeanCallOption(strike=self.market.spot, time_to_maturity=self.time_to_maturity, start_date=self.start_date)
+        tree = TreeVectorized(option=template, market=self.market, nb_steps=self.nb_steps, prunning_value=self.prunning_value, precision=self.precision)
+        tree.generate_tree()
+        return tree
+
+    def _pricing_tree(self, option : Option, smoothing : bool = False) -> TreeVectorized:
+        '''
+        Vue de l'arbre pour une option : nouvelle instance (cached_property propres à l'option) qui référence les colonnes partagées
+        '''
+        if option.time_to_maturity != self.time_to_maturity or option.start_date != self.start_date:
+            raise ValueError("L'option n'a pas la maturité et la date de départ de la grille")
+        return replace(self.tree, option=option, smoothing=smoothing, columns=self.tree.columns)
+
+    def price(self, option : Option, smoothing : bool = False) -> float:
+        '''
+        Prix d'une option (européenne, américaine, bermudéenne ou digitale) par rétropropagation sur la grille, sans la modifier
+        '''
+        return float(self._pricing_tree(option, smoothing).backward_induction()[0][0])
+
+    def price_batch(self, options : list[Option]) -> np.ndarray:
+        '''
+        Prix de plusieurs options rétropropagées ensemble sur la grille (voir TreeVectorized.price_batch)
+        '''
+        for option in options:
+            self._pricing_tree(option)
+        return self._pricing_tree(options[0]).price_batch(options)
@@ -1,5 +1,61 @@
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
+from math import sqrt
+import numpy as np
+
+@dataclass
+class Dividend():
+    '''
+    Dividende détaché à une date : montant cash (amount) et/ou fraction du prix (proportional)
+    '''
+    date : datetime
+    amount : float = 0
+    proportional : float = 0
+
+@dataclass
+class TermStructure():
+    '''
+    Courbe constante par morceaux en fonction du temps (en années depuis le début du contrat) :
+    values[i] s'applique jusqu'au pilier times[i], la dernière valeur est prolongée au delà du dernier pilier
+    '''
+    times : list[float]
+    values : list[float]
+
+    def integral(self, times, power : int = 1) -> np.ndarray:
+        '''
+        Intégrale de la courbe (élevée à la puissance power) de 0 à chaque date, vectorisée sur times
+        '''
+        ends = np.asarray(self.times, dtype=float)
+        starts = np.concatenate(([0.0], ends[:-1]))
+        lengths = np.append(ends[:-1] - starts[:-1], np.inf)
+        elapsed = np.clip(np.asarray(times, dtype=float)[..., None] - starts, 0, lengths)
+        return elapsed @ np.asarray(self.values, dtype=float) ** power
+
+    def shifted(self, shift : float) -> "TermStructure":
+        '''
+        Courbe translatée de shift (choc parallèle pour les grecs)
+        '''
+        return replace(self, values=[value + shift for value in self.values])
+
+@dataclass
+class VolSurface():
+    '''
+    Surface de volatilité locale sigma(S, t) sur une grille : vols[i][j] à la date times[i] (en années) et au prix spots[j],
+    interpolation linéaire et extrapolation plate dans les deux directions
+    '''
+    times : list[float]
+    spots : list[float]
+    vols : list[list[float]]
+
+    def rows(self, times) -> np.ndarray:
+        '''
+        Volatilités interpolées en temps aux dates times, une ligne par date et une colonne par prix de la grille
+        '''
+        vols = np.asarray(self.vols, dtype=float)
+        return np.column_stack([np.interp(times, self.times, vols[:, j]) for j in range(vols.shape[1])])
+
+    def max_volatility(self) -> float:
+        return float(np.max(self.vols))
 
 @dataclass
 class Market():
@@ -8,4 +64,52 @@ class Market():
     volatility : float
     rate : float
     dividende : float = 0
-    div_date : datetime = None
\ No newline at end of file
+    div_date : datetime = None
+    #Calendrier de dividendes (cash et proportionnels), en plus du dividende cash unique (dividende, div_date)
+    dividends : list[Dividend] = field(default_factory=list)
+    #Structures par terme : taux forward instantanés et volatilité constants par morceaux (remplacent rate et volatility si renseignées)
+    rate_curve : TermStructure = None
+    vol_curve : TermStructure = None
+    #Volatilité locale sigma(S, t) : remplace volatility et vol_curve dans l'arbre (tous les moteurs)
+    local_vol : VolSurface = None
+
+    def dividend_schedule(self) -> list[Dividend]:
+        '''
+        Tous les dividendes du marché triés par date
+        '''
+        schedule = list(self.dividends)
+        if self.dividende > 0 and self.div_date is not None:
+            schedule.append(Dividend(date=self.div_date, amount=self.dividende))
+        return sorted(schedule, key=lambda dividend: dividend.date)
+
+    def rate_integral(self, start, end):
+        '''
+        Intégrale du taux entre start et end (en années) : -log du facteur d'actualisation de end vers start
+        '''
+        if self.rate_curve is None:
+            return self.rate * (np.asarray(end) - start)
+        return self.rate_curve.integral(end) - self.rate_curve.integral(start)
+
+    def variance_integral(self, start, end):
+        '''
+        Variance cumulée du log-prix entre start et end (intégrale de la volatilité au carré)
+        '''
+        if self.vol_curve is None:
+            return pow(self.volatility, 2) * (np.asarray(end) - start)
+        return self.vol_curve.integral(end, power=2) - self.vol_curve.integral(start, power=2)
+
+    def flat_parameters(self, maturity : float) -> tuple[float, float]:
+        '''
+        Taux et volatilité constants équivalents jusqu'à maturity (exacts pour une européenne avec des structures déterministes)
+        '''
+        rate = self.rate if self.rate_curve is None else float(self.rate_integral(0, maturity)) / maturity
+        volatility = self.volatility if self.vol_curve is None else sqrt(float(self.variance_integral(0, maturity)) / maturity)
+        return rate, volatility
+
+    def shifted(self, rate : float = 0, volatility : float = 0) -> "Market":
+        '''
+        Marché choqué en parallèle (taux et volatilité plats et courbes)
+        '''
+        return replace(self, rate=self.rate + rate, volatility=self.volatility + volatility,
+                       rate_curve=self.rate_curve.shifted(rate) if self.rate_curve is not None else None,
+                       vol_curve=self.vol_curve.shifted(volatility) if self.vol_curve is not None else None)
@@ -1,6 +1,29 @@
-from math import exp
 from dataclasses import dataclass
-from PythonFiles.market import Market
+import numpy as np
+
+def transition_proba(alpha : float, forward, expectation, variance) -> tuple:
+    '''
+    Probabilités de transition (p_down, p_up, p_mid) par égalisation des deux premiers moments, valable sur des floats ou des tableaux
+    '''
+    p_down = ((forward ** -2 * (variance + expectation ** 2)) - 1 - ((alpha + 1) * ((expectation / forward) - 1))) / ((1 - alpha) * (alpha ** -2 - 1))
+    p_up = ((expectation / forward) - 1 - ((1 / alpha - 1) * p_down)) / (alpha - 1)
+    p_mid = 1 - p_down - p_up
+    return p_down, p_up, p_mid
+
+def clamp_transition_proba(alpha : float, forward, expectation, p_down, p_up) -> tuple:
+    '''
+    Probabilités de transition ramenées dans [0, 1] (tableaux) : quand la variance locale est trop faible face à l'écart entre noeuds,
+    la probabilité négative est mise à zéro et l'autre est recalculée pour garder l'espérance, seule la variance n'est plus égalisée
+    '''
+    drift = expectation / forward - 1
+    p_up_alone = drift / (alpha - 1)
+    p_down_alone = drift / (1 / alpha - 1)
+    p_down, p_up = np.where(p_down < 0, 0.0, np.where(p_up < 0, p_down_alone, p_down)), np.where(p_down < 0, p_up_alone, np.where(p_up < 0, 0.0, p_up))
+    p_down, p_up = np.clip(p_down, 0, 1), np.clip(p_up, 0, 1)
+    #Variance trop forte pour l'écart entre noeuds (p_mid négatif) : p_up et p_down sont réduits au même ratio
+    scale = np.minimum(1, 1 / np.maximum(p_down + p_up, 1e-300))
+    p_down, p_up = p_down * scale, p_up * scale
+    return p_down, p_up, 1 - p_down - p_up
 
 @dataclass
 class Node():
@@ -31,21 +54,27 @@ class Node():
         self.next_down.up_node = self.next_mid
         self.next_mid.prec_node = self
 
-    def compute_transition_proba(self, alpha : float, time_delta : int, market : Market, is_div : bool, dividende : float) -> None:
+    def compute_transition_proba(self, alpha : float, growth_factor : float, variance_factor : float, dividend : tuple[float, float] = None) -> None:
         '''
-        Calcule les probabilités de transition de la node
+        Calcule les probabilités de transition de la node (growth_factor = exp(r*dt), variance_factor = exp(vol²*dt) - 1),
+        dividend = (facteur, montant) au détachement d'un dividende
         '''
         forward = self.next_mid.price
-        if is_div:
-             expectation = self.price * exp(market.rate * time_delta) - dividende
+        factor = 1.0
+        if dividend is not None:
+            factor, dividende = dividend
+            expectation = self.price * growth_factor * factor - dividende
         else :
             expectation = self.next_mid.price
         
-        variance = pow(self.price,2) * exp(2 * market.rate * time_delta) * (exp(pow(market.volatility, 2) * time_delta) -1) 
-        
-        self.p_down = ((pow(forward,-2) * (variance + pow(expectation,2)))- 1 - ((alpha+1) * ((pow(forward, -1)*expectation)-1))) / ((1 - alpha) * (pow(alpha,-2) - 1))
-        self.p_up = ((pow(forward,-1)*expectation)-1-((alpha**(-1)-1)*self.p_down))/(alpha-1)
-        self.p_mid = 1 - self.p_down - self.p_up
+        variance = pow(self.price * growth_factor * factor, 2) * variance_factor
+        self.p_down, self.p_up, self.p_mid = transition_proba(alpha, forward, expectation, variance)
+
+    def set_transition_proba(self, proba : tuple) -> None:
+        '''
+        Affecte un triplet (p_down, p_up, p_mid) précalculé, identique pour toutes les nodes hors dividende
+        '''
+        self.p_down, self.p_up, self.p_mid = proba
 
     def branch_monomial(self) -> None:
         '''
@@ -64,9 +93,9 @@ class Node():
         self.next_mid.node_proba = self.next_mid.node_proba + self.node_proba * self.p_mid
         self.next_down.node_proba = self.next_down.node_proba + self.node_proba * self.p_down
 
-    def node_payoff(self, step : int, option, exercise_steps : list[int], rate : float, time_delta : float) -> None:
+    def node_payoff(self, option, is_exercise : bool, discount : float) -> None:
         '''
-        Calcule le payoff du noeud en fonction du type d'exercice 
+        Calcule le payoff du noeud en fonction du type d'exercice (is_exercise et discount sont évalués une fois par colonne)
         ''' 
         #Calcul de chaque prix suivant multiplié par la proba de transition
         value_up = self.next_up.payoff * self.p_up if self.next_up is not None else 0
@@ -75,11 +104,43 @@ class Node():
 
         #Prix retropropagé de l'option : moyenne pondérée par les proba actualisée
         expectation = value_up + value_down + value_mid
-        retro_payoff = expectation * exp(-rate * time_delta)
+        retro_payoff = expectation * discount
 
         #Exercice américain, on regarde s'il est avantageux d'exercer à ce timeStep
-        if step in exercise_steps:
+        if is_exercise:
             exercise_payoff = option.payoff(self.price)
             self.payoff = max(retro_payoff, exercise_payoff)
         else:
-            self.payoff = retro_payoff
\ No newline at end of file
+            self.payoff = retro_payoff
+
+@dataclass(slots=True)
+class CompactNode():
+    '''
+    Même node que Node mais sans __dict__ par instance (__slots__) : environ 20% de mémoire en moins par noeud
+    (177 octets contre 226 pour Node mesurés par benchmark.memory_per_node, put américain à 1000 pas).
+    L'objectif d'une mémoire divisée par 3 n'est pas atteint avec des noeuds : seules les colonnes de TreeVectorized y parviennent
+    (12 octets par noeud en float64, 7.5 en float32 à 800 pas)
+    '''
+
+    price : float
+    payoff : float = None
+    
+    next_up : 'CompactNode' = None
+    next_mid : 'CompactNode' = None
+    next_down : 'CompactNode' = None
+    up_node : 'CompactNode' = None
+    down_node : 'CompactNode' = None
+    prec_node : 'CompactNode' = None
+
+    p_down : float = None
+    p_up : float = None
+    p_mid : float = None
+
+    node_proba : float = 0
+
+    branch_triplet = Node.branch_triplet
+    compute_transition_proba = Node.compute_transition_proba
+    set_transition_proba = Node.set_transition_proba
+    branch_monomial = Node.branch_monomial
+    update_proba = Node.update_proba
+    node_payoff = Node.node_payoff
@@ -1,9 +1,9 @@
-from math import log, sqrt, exp
+from math import sqrt, exp, ceil
 from datetime import datetime
-from scipy.stats import norm
 from abc import ABC
 import numpy as np
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
+from PythonFiles.blackScholes import compute_d1, compute_d2, black_scholes_price, digital_price, barrier_out_price
 
 @dataclass
 class Option(ABC):
@@ -13,20 +13,99 @@ class Option(ABC):
     start_date : datetime = None
 
     def d1(self, market) -> float:
-        spot_adjusted = market.spot - market.dividende
-        return (log(spot_adjusted/self.strike) + self.time_to_maturity * (market.rate + (pow(market.volatility, 2)/2)))/(market.volatility * sqrt(self.time_to_maturity))
+        rate, volatility = market.flat_parameters(self.time_to_maturity)
+        return float(compute_d1(market.spot, self.strike, self.time_to_maturity, volatility, rate, market.dividende))
 
     def d2(self, market) -> float:
-        return self.d1(market) - market.volatility*sqrt(self.time_to_maturity)
+        rate, volatility = market.flat_parameters(self.time_to_maturity)
+        return float(compute_d2(market.spot, self.strike, self.time_to_maturity, volatility, rate, market.dividende))
     
     def compute_price(self,market, n_sim=100000):
-        Z = np.random.normal(0, 1, n_sim)
-        prices = market.spot * np.exp(
-            (market.rate - 0.5 * pow(market.volatility, 2)) * self.time_to_maturity +
-            market.volatility * np.sqrt(self.time_to_maturity) * Z
-        )
-        payoffs=np.array([self.payoff(S) for S in prices])
-        return exp(-market.rate*self.time_to_maturity) * np.mean(payoffs)
+        return self.monte_carlo(market, n_sim)[0]
+
+    def dividend_times(self, market) -> list[tuple[float, object]]:
+        '''
+        Dividendes détachés avant la maturité, avec leur date en années depuis le début du contrat.
+        Sans start_date, un dividende ne peut pas être placé dans le temps : erreur plutôt que de l'ignorer
+        '''
+        schedule = market.dividend_schedule()
+        if self.start_date is None:
+            if schedule:
+                raise ValueError("Une date de début (start_date) est nécessaire pour placer les dividendes du marché")
+            return []
+        div_times = [((dividend.date - self.start_date).days / 365, dividend) for dividend in schedule]
+        return [(div_time, dividend) for div_time, dividend in div_times if 0 < div_time <= self.time_to_maturity]
+
+    def simulate_prices(self, market, normals : np.ndarray, div_times : list[tuple[float, object]] = ()) -> np.ndarray:
+        '''
+        Prix terminaux simulés à partir de tirages normaux (une ligne de tirages par période : une de plus que de dividendes détachés).
+        Taux et variance de chaque période sont intégrés sur les structures par terme du marché
+        '''
+        def diffuse(prices, start : float, end : float, normals : np.ndarray):
+            variance = float(market.variance_integral(start, end))
+            return prices * np.exp(float(market.rate_integral(start, end)) - 0.5 * variance + sqrt(variance) * normals)
+
+        prices, last_time = market.spot, 0
+        for period, (div_time, dividend) in enumerate(div_times):
+            prices = diffuse(prices, last_time, div_time, normals[period])
+            prices = np.maximum(prices * (1 - dividend.proportional) - dividend.amount, 0)
+            last_time = div_time
+        return diffuse(prices, last_time, self.time_to_maturity, normals[-1])
+
+    def monte_carlo(self, market, n_sim : int = 100000, antithetic : bool = True, control_variate : bool = True, rng = None, chunk_size : int = 1000000) -> tuple[float, float]:
+        '''
+        Prix Monte Carlo vectorisé et son erreur standard. Les trajectoires sont simulées par paquets de chunk_size (mémoire bornée),
+        avec variables antithétiques et variable de contrôle : le call Black-Scholes de même strike sans dividende, le forward sinon.
+        rng accepte une graine ou un np.random.Generator
+        '''
+        rng = np.random.default_rng(rng)
+        discount = exp(-float(market.rate_integral(0, self.time_to_maturity)))
+        div_times = self.dividend_times(market)
+        if not div_times:
+            control_mean = EuropeanCallOption(strike=self.strike, time_to_maturity=self.time_to_maturity).compute_price(replace(market, dividende=0, dividends=[]))
+            control_payoff = lambda prices: discount * np.maximum(prices - self.strike, 0)
+        else:
+            #Forward actualisé : spot réduit des dividendes proportionnels, moins la valeur actuelle des montants cash
+            control_mean = market.spot
+            for div_time, dividend in div_times:
+                control_mean = control_mean * (1 - dividend.proportional) - dividend.amount * exp(-float(market.rate_integral(0, div_time)))
+            control_payoff = lambda prices: discount * prices
+
+        #Statistiques agrégées paquet par paquet : effectif, moyennes, sommes des carrés des écarts et co-moment
+        count, mean_y, mean_c, m2_y, m2_c, co_moment = 0, 0.0, 0.0, 0.0, 0.0, 0.0
+        nb_periods = len(div_times) + 1
+        remaining = n_sim
+        while remaining > 0:
+            size = min(chunk_size, remaining)
+            remaining -= size
+            normals = rng.standard_normal((nb_periods, ceil(size / 2) if antithetic else size))
+            prices = self.simulate_prices(market, normals, div_times)
+            samples_y = discount * self.payoff_vector(prices)
+            samples_c = control_payoff(prices)
+            if antithetic:
+                #Un échantillon = moyenne de la paire (Z, -Z), les paires sont indépendantes entre elles
+                prices = self.simulate_prices(market, -normals, div_times)
+                samples_y = (samples_y + discount * self.payoff_vector(prices)) / 2
+                samples_c = (samples_c + control_payoff(prices)) / 2
+
+            chunk_count = len(samples_y)
+            chunk_mean_y, chunk_mean_c = samples_y.mean(), samples_c.mean()
+            delta_y, delta_c = chunk_mean_y - mean_y, chunk_mean_c - mean_c
+            total = count + chunk_count
+            m2_y += np.sum((samples_y - chunk_mean_y) ** 2) + delta_y ** 2 * count * chunk_count / total
+            m2_c += np.sum((samples_c - chunk_mean_c) ** 2) + delta_c ** 2 * count * chunk_count / total
+            co_moment += np.sum((samples_y - chunk_mean_y) * (samples_c - chunk_mean_c)) + delta_y * delta_c * count * chunk_count / total
+            mean_y += delta_y * chunk_count / total
+            mean_c += delta_c * chunk_count / total
+            count = total
+
+        variance = m2_y / max(count - 1, 1)
+        price = mean_y
+        if control_variate and m2_c > 0:
+            beta = co_moment / m2_c
+            price = mean_y - beta * (mean_c - control_mean)
+            variance = (m2_y - beta * co_moment) / max(count - 2, 1)
+        return float(price), sqrt(max(variance, 0) / count)
 
 @dataclass
 class CallOption(Option):
@@ -34,24 +113,36 @@ class CallOption(Option):
     def payoff(self, price : float) -> float:
         return max(0, (price - self.strike))
 
+    def payoff_vector(self, prices : np.ndarray) -> np.ndarray:
+        return np.maximum(prices - self.strike, 0)
+
 @dataclass   
 class PutOption(Option):
     def payoff(self, price : float) -> float:
         return max(0, (self.strike - price))
 
+    def payoff_vector(self, prices : np.ndarray) -> np.ndarray:
+        return np.maximum(self.strike - prices, 0)
+
 @dataclass 
 class EuropeanCallOption(CallOption):
     
     def compute_price(self, market) -> float:
-        spot_adjusted = market.spot - market.dividende
-        return spot_adjusted * norm.cdf(self.d1(market)) - self.strike * exp(-market.rate*self.time_to_maturity)*norm.cdf(self.d2(market))
+        #Calendrier de dividendes : pas de formule fermée, Monte Carlo
+        if market.dividends:
+            return super().compute_price(market)
+        #Structures par terme déterministes : Black-Scholes avec le taux et la volatilité moyens jusqu'à maturité
+        rate, volatility = market.flat_parameters(self.time_to_maturity)
+        return float(black_scholes_price(market.spot, self.strike, self.time_to_maturity, volatility, rate, market.dividende, is_call=True))
 
 @dataclass
 class EuropeanPutOption(PutOption):
     
     def compute_price(self, market):
-        spot_adjusted = market.spot - market.dividende
-        return -spot_adjusted * norm.cdf(-self.d1(market)) + self.strike * exp(-market.rate*self.time_to_maturity)*norm.cdf(-self.d2(market))
+        if market.dividends:
+            return super().compute_price(market)
+        rate, volatility = market.flat_parameters(self.time_to_maturity)
+        return float(black_scholes_price(market.spot, self.strike, self.time_to_maturity, volatility, rate, market.dividende, is_call=False))
 
 class AmericanCallOption(CallOption):
     pass
@@ -76,6 +167,15 @@ class DigitalCallOption(Option):
             return self.coupon
         else:
             return 0
+
+    def payoff_vector(self, prices : np.ndarray) -> np.ndarray:
+        return np.where(prices > self.strike, self.coupon, 0.0)
+
+    def compute_price(self, market) -> float:
+        if market.dividends:
+            return super().compute_price(market)
+        rate, volatility = market.flat_parameters(self.time_to_maturity)
+        return float(digital_price(market.spot, self.strike, self.time_to_maturity, volatility, rate, market.dividende, is_call=True, coupon=self.coupon))
         
 @dataclass
 class DigitalPutOption(Option):
@@ -86,4 +186,57 @@ class DigitalPutOption(Option):
             return self.coupon
         else:
             return 0
-    
\ No newline at end of file
+
+    def payoff_vector(self, prices : np.ndarray) -> np.ndarray:
+        return np.where(prices < self.strike, self.coupon, 0.0)
+
+    def compute_price(self, market) -> float:
+        if market.dividends:
+            return super().compute_price(market)
+        rate, volatility = market.flat_parameters(self.time_to_maturity)
+        return float(digital_price(market.spot, self.strike, self.time_to_maturity, volatility, rate, market.dividende, is_call=False, coupon=self.coupon))
+
+@dataclass
+class BarrierOption(Option):
+    '''
+    Option à barrière : direction "up" ou "down", knock "out" (désactivée au franchissement) ou "in" (activée au franchissement).
+    Sans monitoring_dates la barrière est observée en continu (à chaque timeStep de l'arbre), sinon seulement aux dates données
+    '''
+    barrier : float = None
+    direction : str = "up"
+    knock : str = "out"
+    monitoring_dates : list[datetime] = field(default_factory=list)
+
+    def is_breached(self, prices, tolerance : float = 0.0):
+        '''
+        Vrai aux prix qui ont franchi la barrière (barrière incluse, à la tolérance relative près), valable sur des floats ou des tableaux
+        '''
+        if self.direction == "up":
+            return prices >= self.barrier * (1 - tolerance)
+        return prices <= self.barrier * (1 + tolerance)
+
+    def compute_price(self, market) -> float:
+        '''
+        Formule fermée de la barrière continue (knock-in par parité avec la vanille), le dividende cash est retranché du spot comme dans Black-Scholes.
+        Observation discrète : barrière décalée de exp(±0.5826 vol sqrt(dt)) (correction de Broadie-Glasserman-Kou)
+        '''
+        if market.dividends:
+            raise ValueError("Pas de formule fermée pour une barrière avec un calendrier de dividendes : pricer avec l'arbre")
+        rate, volatility = market.flat_parameters(self.time_to_maturity)
+        is_call, is_up = isinstance(self, CallOption), self.direction == "up"
+        barrier = self.barrier
+        if self.monitoring_dates:
+            barrier = barrier * exp((1 if is_up else -1) * 0.5826 * volatility * sqrt(self.time_to_maturity / len(self.monitoring_dates)))
+        spot = market.spot - market.dividende
+        knock_out = float(barrier_out_price(spot, self.strike, barrier, self.time_to_maturity, volatility, rate, is_call, is_up))
+        if self.knock == "out":
+            return knock_out
+        return float(black_scholes_price(spot, self.strike, self.time_to_maturity, volatility, rate, 0, is_call)) - knock_out
+
+@dataclass
+class BarrierCallOption(BarrierOption, CallOption):
+    pass
+
+@dataclass
+class BarrierPutOption(BarrierOption, PutOption):
+    pass
@@ -0,0 +1,132 @@
+import copy
+import pickle
+import sqlite3
+import hashlib
+import threading
+from datetime import date
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields, is_dataclass
+import numpy as np
+from PythonFiles.market import Market
+from PythonFiles.options import Option
+from PythonFiles.tree import Tree
+
+def _canonical(value):
+    '''
+    Forme canonique d'un paramètre : les nombres en float (100 et 100.0 donnent le même arbre), les dates en ISO, les listes en tuples.
+    Les tableaux et scalaires numpy sont convertis en types Python avant : leur repr tronque les grands tableaux
+    '''
+    if isinstance(value, type):
+        return value.__name__
+    if is_dataclass(value):
+        return (type(value).__name__,) + tuple((f.name, _canonical(getattr(value, f.name))) for f in fields(value))
+    if isinstance(value, np.ndarray):
+        return _canonical(value.tolist())
+    if isinstance(value, np.generic):
+        return _canonical(value.item())
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_canonical(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _canonical(item)) for key, item in value.items()))
+    return repr(value)
+
+def cache_key(market : Market, option : Option, nb_steps : int, prunning_value : float, **settings) -> str:
+    '''
+    Hash canonique des paramètres qui déterminent le prix : marché, option (dates d'exercice et coupon compris), nombre de pas, prunning et options du modèle
+    '''
+    canonical = _canonical((market, option, nb_steps, prunning_value, settings))
+    return hashlib.sha256(repr(canonical).encode()).hexdigest()
+
+@dataclass
+class PriceCache:
+    '''
+    Cache LRU des résultats de pricing borné en mémoire (taille des valeurs picklées), avec un second niveau optionnel sur disque (SQLite)
+    '''
+    max_bytes : int = 64 * 1024 * 1024
+    db_path : str = None
+
+    memory_hits : int = 0
+    disk_hits : int = 0
+    misses : int = 0
+
+    entries : OrderedDict = field(default_factory=OrderedDict)
+    nb_bytes : int = 0
+    lock : threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        if self.db_path is not None:
+            with sqlite3.connect(self.db_path) as connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS prices (key TEXT PRIMARY KEY, value BLOB)")
+
+    def get(self, key : str):
+        '''
+        Renvoie une copie de la valeur en cache (None si absente), en remontant en mémoire une valeur trouvée sur disque.
+        Copie : modifier le résultat renvoyé ne doit pas corrompre le cache
+        '''
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(self.entries[key][0])
+        if self.db_path is not None:
+            with sqlite3.connect(self.db_path) as connection:
+                row = connection.execute("SELECT value FROM prices WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                value = pickle.loads(row[0])
+                self._store(key, value, len(row[0]))
+                with self.lock:
+                    self.disk_hits += 1
+                return copy.deepcopy(value)
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key : str, value) -> None:
+        '''
+        Ajoute une copie de la valeur en mémoire (et sur disque si db_path)
+        '''
+        blob = pickle.dumps(value)
+        self._store(key, pickle.loads(blob), len(blob))
+        if self.db_path is not None:
+            with sqlite3.connect(self.db_path) as connection:
+                connection.execute("INSERT OR REPLACE INTO prices (key, value) VALUES (?, ?)", (key, blob))
+
+    def _store(self, key : str, value, size : int) -> None:
+        '''
+        Stocke en mémoire et évince les entrées les moins récemment utilisées au delà de max_bytes
+        '''
+        with self.lock:
+            if key in self.entries:
+                self.nb_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.nb_bytes += size
+            while self.nb_bytes > self.max_bytes and len(self.entries) > 1:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.nb_bytes -= evicted_size
+
+    def price(self, market : Market, option : Option, nb_steps : int, prunning_value : float, engine : type[Tree] = Tree, **settings) -> float:
+        '''
+        Prix de l'arbre, calculé seulement si le même contrat n'a pas déjà été pricé
+        '''
+        key = cache_key(market, option, nb_steps, prunning_value, engine=engine, **settings)
+        price = self.get(key)
+        if price is None:
+            tree = engine(option=option, market=market, nb_steps=nb_steps, prunning_value=prunning_value, **settings)
+            tree.generate_tree()
+            price = tree.price()
+            self.put(key, price)
+        return price
+
+    def stats(self) -> dict:
+        '''
+        Compteurs de hits/miss et occupation du cache
+        '''
+        with self.lock:
+            return {"Memory Hits" : self.memory_hits, "Disk Hits" : self.disk_hits, "Misses" : self.misses,
+                    "Entries" : len(self.entries), "Bytes" : self.nb_bytes}
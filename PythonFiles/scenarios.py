@@ -0,0 +1,64 @@
+import os
+import time
+from math import ceil
+from dataclasses import dataclass, replace
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from PythonFiles.market import Market
+from PythonFiles.options import Option
+from PythonFiles.tree import Tree
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.greeks import Greeks
+
+@dataclass
+class PricingJob:
+    '''
+    Scénario de pricing indépendant, envoyé tel quel (picklé) à un process du pool
+    '''
+    market : Market
+    option : Option
+    nb_steps : int
+    prunning_value : float = 1e-10
+    price_tolerance : float = None
+    greeks : bool = False
+    engine : type[Tree] = TreeVectorized
+
+def run_job(job : PricingJob) -> dict:
+    '''
+    Price un scénario (et ses grecs si demandé) et renvoie une ligne de résultats
+    '''
+    start = time.time()
+    tree = job.engine(option=job.option, market=job.market, nb_steps=job.nb_steps, prunning_value=job.prunning_value, price_tolerance=job.price_tolerance)
+    if job.greeks:
+        greeks = Greeks(tree=tree, epsilon=0.01, from_lattice=True)
+        greeks.compute_greeks()
+        result = {"Price" : greeks.price_tree, "Delta" : greeks.delta, "Gamma" : greeks.gamma, "Vega" : greeks.vega, "Theta" : greeks.theta, "Rho" : greeks.rho}
+    else:
+        tree.generate_tree()
+        result = {"Price" : tree.price()}
+    result["Time"] = time.time() - start
+    return result
+
+def run_scenarios(jobs : list[PricingJob], max_workers : int = None, chunksize : int = None) -> pd.DataFrame:
+    '''
+    Répartit les scénarios sur un pool de process et renvoie les résultats dans l'ordre de soumission.
+    Les scénarios sont envoyés par paquets (chunksize) pour que le pickling ne domine pas sur les petits arbres
+    '''
+    max_workers = max_workers or os.cpu_count()
+    if max_workers == 1 or len(jobs) <= 1:
+        return pd.DataFrame([run_job(job) for job in jobs])
+    if chunksize is None:
+        chunksize = max(1, ceil(len(jobs) / (4 * max_workers)))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(run_job, jobs, chunksize=chunksize))
+    return pd.DataFrame(results)
+
+def spot_ladder(market : Market, option : Option, spots : list[float], nb_steps : int, prunning : float, greeks : bool = True,
+                max_workers : int = None, chunksize : int = None, engine : type[Tree] = TreeVectorized) -> pd.DataFrame:
+    '''
+    Prix (et grecs) de l'option pour chaque spot de l'échelle, calculés en parallèle
+    '''
+    jobs = [PricingJob(market=replace(market, spot=spot), option=option, nb_steps=nb_steps, prunning_value=prunning, greeks=greeks, engine=engine) for spot in spots]
+    df = run_scenarios(jobs, max_workers=max_workers, chunksize=chunksize)
+    df.insert(0, "Spot", list(spots))
+    return df
@@ -1,10 +1,29 @@
-from math import exp, sqrt, ceil
+import time
+from math import exp, sqrt, ceil, log, erfc
 from typing import Union
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 from functools import cached_property
+import numpy as np
+from scipy.special import ndtri
 from PythonFiles.market import Market
-from PythonFiles.node import Node
-from PythonFiles.options import EuropeanCallOption, EuropeanPutOption, AmericanCallOption, AmericanPutOption, BermudeanCallOption, BermudeanPutOption
+from PythonFiles.node import Node, CompactNode, transition_proba, clamp_transition_proba
+from PythonFiles.blackScholes import black_scholes_price
+from PythonFiles.instrumentation import TreeReport, instrumented
+from PythonFiles.options import CallOption, PutOption, EuropeanCallOption, EuropeanPutOption, AmericanCallOption, AmericanPutOption, BermudeanCallOption, BermudeanPutOption, DigitalCallOption, DigitalPutOption, BarrierOption
+
+#Entrées qui définissent la grille (prix et probabilités) : toute modification impose de régénérer l'arbre.
+#Les autres entrées suivies (type d'option, strike, coupon, dates d'exercice, barrière, lissage) ne changent que la rétropropagation,
+#sauf avec price_tolerance où le prunning dépend aussi du payoff, et avec barrier_alignment où la grille est ancrée sur la barrière.
+#L'instrumentation est suivie comme la grille : le rapport de construction n'est produit que par generate_tree
+LATTICE_INPUTS = frozenset({"spot", "volatility", "rate", "dividende", "div_date", "dividends", "rate_curve", "vol_curve", "local_vol", "time_to_maturity", "start_date", "nb_steps", "prunning_value", "price_tolerance", "compact_nodes", "barrier_alignment",
+                            "instrument", "instrument_memory"})
+SQRT_2 = sqrt(2)
+PAYOFF_PROPERTIES = ("exercise_steps", "exercise_mask", "_estimate_kind", "_estimate_constants", "smooth_last_step", "knock", "barrier_mask")
+#Quand seule la volatilité change (volatilité implicite), la grille est régénérée mais les attributs qui ne dépendent que
+#des timeSteps, des taux et du payoff sont gardés
+VOLATILITY_INPUTS = frozenset({"volatility", "vol_curve"})
+TIME_GRID_PROPERTIES = ("time_delta", "node_class", "step_times", "rate_integrals", "growth_factors", "discount_factors", "dividend_steps",
+                        "exercise_steps", "exercise_mask", "knock", "barrier_mask", "_estimate_kind")
 
 @dataclass
 class Tree():
@@ -16,6 +35,19 @@ class Tree():
     last_node : Node = None
     
     prunning_value : float = None
+    #Tolérance cible sur le prix : si renseignée, remplace prunning_value et le prunning est dérivé par colonne (voir _prunable)
+    price_tolerance : float = None
+    compact_nodes : bool = False
+    smoothing : bool = False
+    #Options à barrière : tronc recentré à chaque pas pour qu'une couche de noeuds tombe exactement sur la barrière
+    barrier_alignment : bool = False
+    built_inputs : dict = field(default=None, repr=False, compare=False)
+    #Instrumentation optionnelle : temps et pic mémoire par phase, noeuds par colonne, prunning et recherches du mid (voir TreeReport)
+    instrument : bool = False
+    instrument_memory : bool = False
+    report : TreeReport = field(default=None, repr=False, compare=False)
+    column_cuts : tuple[float, float] = field(default=None, repr=False, compare=False)
+    column_edges : tuple[Node, Node] = field(default=None, repr=False, compare=False)
 
     ''' --------------------------------------------------------------------------------------------------------------------------------- '''
     '''                                                     Section Attributs calculés                                                            '''
@@ -27,94 +59,513 @@ class Tree():
 
     @cached_property
     def alpha(self) -> float:
-        return exp(self.market.volatility * sqrt(3 * self.time_delta)  )
+        '''
+        Écart entre deux noeuds d'une colonne, dimensionné sur le pas de plus forte variance (volatilité par terme) :
+        les probabilités de transition restent positives à chaque pas. En volatilité locale, sur la plus forte volatilité de la surface
+        '''
+        if self.market.local_vol is not None:
+            return exp(self.market.local_vol.max_volatility() * sqrt(3 * self.time_delta))
+        return exp(sqrt(3 * self.variance_integrals.max()))
 
     @cached_property
-    def div_step(self) -> float:
+    def node_class(self) -> type:
         '''
-        Définit le timeStep auquel le détachement du dividende va avoir lieu en fonction des dates
+        Classe des noeuds générés : CompactNode (__slots__) si compact_nodes, sinon Node
         '''
-        if self.market.dividende <= 0:
-            return -1
-        else:
-            time_delta_in_days = self.time_delta * 365
-            return ceil((self.market.div_date - self.option.start_date).days/time_delta_in_days)
+        return CompactNode if self.compact_nodes else Node
+
+    @cached_property
+    def step_times(self) -> np.ndarray:
+        return np.arange(self.nb_steps + 1) * self.time_delta
+
+    @cached_property
+    def rate_integrals(self) -> np.ndarray:
+        '''
+        Intégrale du taux sur chaque pas (du timeStep i au timeStep i+1), taux plat ou courbe des taux
+        '''
+        return self.market.rate_integral(self.step_times[:-1], self.step_times[1:])
+
+    @cached_property
+    def variance_integrals(self) -> np.ndarray:
+        '''
+        Variance du log-prix sur chaque pas, volatilité plate ou par terme
+        '''
+        return self.market.variance_integral(self.step_times[:-1], self.step_times[1:])
+
+    #Facteurs par pas calculés une fois par arbre : listes de floats, indexées par timeStep dans les boucles par noeud de Tree
+    @cached_property
+    def growth_factors(self) -> list[float]:
+        return np.exp(self.rate_integrals).tolist()
+
+    @cached_property
+    def discount_factors(self) -> list[float]:
+        return np.exp(-self.rate_integrals).tolist()
+
+    @cached_property
+    def variance_factors(self) -> list[float]:
+        return (np.exp(self.variance_integrals) - 1).tolist()
+
+    @cached_property
+    def transition_probas(self) -> list[tuple[float, float, float]]:
+        '''
+        Triplet (p_down, p_up, p_mid) de chaque pas, commun à toutes les nodes hors dividende : forward et espérance sont confondus
+        et le ratio variance/forward² ne dépend pas du prix
+        '''
+        drifts = self.trunk_drifts
+        p_down, p_up, p_mid = transition_proba(self.alpha, 1.0, drifts, drifts ** 2 * np.array(self.variance_factors))
+        if self.barrier_alignment:
+            p_down, p_up, p_mid = clamp_transition_proba(self.alpha, 1.0, drifts, p_down, p_up)
+        return list(zip(p_down.tolist(), p_up.tolist(), p_mid.tolist()))
+
+    @cached_property
+    def trunk_drifts(self) -> np.ndarray:
+        '''
+        Rapport entre le forward du tronc et le noeud mid suivant sur chaque pas : 1 sans barrier_alignment. Avec, le tronc est ancré
+        sur la grille barrière * alpha^k (voir _barrier_anchor) et le forward s'écarte du mid d'au plus un demi-noeud
+        '''
+        if not self.barrier_alignment:
+            return np.ones(self.nb_steps)
+        #À partir du timeStep 1 le tronc est sur la grille : l'écart ne dépend que du facteur de croissance du pas
+        growth = np.exp(self.rate_integrals)
+        drifts = growth / self.alpha ** np.round(np.log(growth) / log(self.alpha))
+        if self.nb_steps > 0:
+            forward = self.market.spot * growth[0]
+            drifts[0] = forward / self._barrier_anchor(forward)
+        return drifts
+
+    def _barrier_anchor(self, price : float) -> float:
+        '''
+        Noeud de la grille barrière * alpha^k le plus proche du prix (en log-prix)
+        '''
+        if not isinstance(self.option, BarrierOption):
+            raise ValueError("barrier_alignment n'est disponible que pour les options à barrière")
+        barrier = self.option.barrier
+        return barrier * self.alpha ** round(log(price / barrier) / log(self.alpha))
+
+    @cached_property
+    def local_vol_rows(self) -> np.ndarray:
+        '''
+        Surface de volatilité locale interpolée au début de chaque pas (une ligne par timeStep, une colonne par prix de la grille)
+        '''
+        return self.market.local_vol.rows(self.step_times)
+
+    def _local_volatility(self, prices : np.ndarray, step : int) -> np.ndarray:
+        '''
+        Volatilité locale de toute une colonne, interpolée en prix sur la ligne du timeStep
+        '''
+        return np.interp(prices, self.market.local_vol.spots, self.local_vol_rows[step])
+
+    def _local_vol_probas(self, prices : np.ndarray, step : int) -> tuple:
+        '''
+        Probabilités de transition (p_down, p_up, p_mid) des noeuds d'une colonne régulière (sans dividende) en volatilité locale :
+        même écart au mid que transition_probas, variance interpolée noeud par noeud. Recalculées à la demande, elles ne sont pas stockées
+        '''
+        drift = self.trunk_drifts[step]
+        variance_factors = np.exp(self._local_volatility(prices, step) ** 2 * self.time_delta) - 1
+        p_down, p_up, _ = transition_proba(self.alpha, 1.0, drift, drift ** 2 * variance_factors)
+        return clamp_transition_proba(self.alpha, 1.0, drift, p_down, p_up)
+
+    @cached_property
+    def remaining_integrals(self) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Intégrales du taux et de la variance de chaque timeStep jusqu'à la maturité
+        '''
+        remaining_rate = np.append(np.cumsum(self.rate_integrals[::-1])[::-1], 0.0)
+        remaining_variance = np.append(np.cumsum(self.variance_integrals[::-1])[::-1], 0.0)
+        return remaining_rate, remaining_variance
+
+    @cached_property
+    def dividend_steps(self) -> dict[int, tuple[float, float]]:
+        '''
+        Définit les timeSteps auxquels les dividendes sont détachés en fonction des dates : {step : (facteur, montant)},
+        le forward d'un noeud vaut alors prix * growth_factors[step-1] * facteur - montant. Les dividendes d'un même timeStep sont composés dans l'ordre des dates
+        '''
+        time_delta_in_days = self.time_delta * 365
+        dividend_steps = {}
+        for dividend in self.market.dividend_schedule():
+            step = ceil((dividend.date - self.option.start_date).days/time_delta_in_days)
+            if 0 < step <= self.nb_steps:
+                factor, amount = dividend_steps.get(step, (1.0, 0.0))
+                dividend_steps[step] = (factor * (1 - dividend.proportional), amount * (1 - dividend.proportional) + dividend.amount)
+        return dividend_steps
+
+    def _dividend_forward(self, prices, step : int, dividend : tuple[float, float]):
+        '''
+        Forward au détachement d'un dividende (facteur, montant) sur le pas step -> step+1, valable sur des floats ou des tableaux
+        '''
+        factor, amount = dividend
+        return prices * self.growth_factors[step] * factor - amount
+
+    def _remaining_dividends(self, step : int) -> tuple[float, float]:
+        '''
+        Dividendes détachés après le timeStep step, composés en un seul (facteur, montant) sans actualisation
+        '''
+        factor, amount = 1.0, 0.0
+        for div_step, (div_factor, div_amount) in sorted(self.dividend_steps.items()):
+            if div_step > step:
+                factor, amount = factor * div_factor, amount * div_factor + div_amount
+        return factor, amount
 
     @cached_property
     def exercise_steps(self) -> list[int]:
         '''
         Définit une liste qui contient tous les timeSteps où l'option peut être exécutée
         '''
-        if isinstance(self.option, BermudeanCallOption) or isinstance(self.option, BermudeanPutOption):
-            exercise_dates = self.option.exercise_dates
+        return self._option_exercise_steps(self.option)
+
+    @cached_property
+    def exercise_mask(self) -> np.ndarray:
+        '''
+        Masque booléen des timeSteps d'exercice (un élément par colonne) : test en O(1) au lieu d'un parcours de la liste
+        '''
+        return self._option_exercise_mask(self.option)
+
+    def _option_exercise_steps(self, option) -> list[int]:
+        '''
+        TimeSteps d'exercice d'une option de même maturité sur la grille de temps de l'arbre (sans construire d'arbre pour cette option)
+        '''
+        if isinstance(option, BermudeanCallOption) or isinstance(option, BermudeanPutOption):
             time_delta_in_days = self.time_delta * 365
-            return [ceil((ex_date - self.option.start_date).days/time_delta_in_days) for ex_date in exercise_dates]
-        
-        elif isinstance(self.option, AmericanCallOption) or isinstance(self.option, AmericanPutOption):
+            return [ceil((ex_date - option.start_date).days/time_delta_in_days) for ex_date in option.exercise_dates]
+
+        elif isinstance(option, AmericanCallOption) or isinstance(option, AmericanPutOption):
             return [i for i in range(self.nb_steps)]
-        
+
         else:
             return []
-    
+
+    def _option_exercise_mask(self, option) -> np.ndarray:
+        mask = np.zeros(self.nb_steps + 1, dtype=bool)
+        mask[[step for step in self._option_exercise_steps(option) if 0 <= step <= self.nb_steps]] = True
+        return mask
+
+    @cached_property
+    def knock(self) -> str:
+        '''
+        Type de barrière de l'option ("out" ou "in"), None hors options à barrière
+        '''
+        return self.option.knock if isinstance(self.option, BarrierOption) else None
+
+    @cached_property
+    def barrier_mask(self) -> np.ndarray:
+        '''
+        Masque booléen des timeSteps où la barrière est observée : toutes les colonnes en observation continue, sinon le timeStep de chaque date d'observation
+        '''
+        mask = np.zeros(self.nb_steps + 1, dtype=bool)
+        if self.knock is None:
+            return mask
+        if not self.option.monitoring_dates:
+            mask[:] = True
+            return mask
+        time_delta_in_days = self.time_delta * 365
+        steps = [ceil((date - self.option.start_date).days/time_delta_in_days) for date in self.option.monitoring_dates]
+        mask[[step for step in steps if 0 <= step <= self.nb_steps]] = True
+        return mask
+
+    def _knock(self, values : np.ndarray, prices : np.ndarray, knocked) -> np.ndarray:
+        '''
+        Masque de barrière d'une colonne observée : les noeuds qui franchissent la barrière prennent la valeur knocked (0 pour un knock-out,
+        valeurs de la vanille sur la colonne pour un knock-in). La tolérance garde dans le masque la couche de noeuds posée sur la barrière
+        (arrondis de alpha^k, ou des prix stockés en float32)
+        '''
+        prices = np.asarray(prices)
+        #Les prix de Tree peuvent être entiers (root au spot) : arrondi du float64 dans ce cas
+        precision = prices.dtype if np.issubdtype(prices.dtype, np.floating) else np.float64
+        tolerance = max(1e-9, 8 * np.finfo(precision).eps)
+        return np.where(self.option.is_breached(prices, tolerance), knocked, values)
+
+    @cached_property
+    def width_bound(self) -> np.ndarray:
+        '''
+        Nombre maximal de noeuds de part et d'autre du tronc à chaque timeStep, sans dividende ni price_tolerance.
+        Le décalage au tronc après i pas est approché par une loi normale (dérive et variance cumulées des pas de transition_probas) :
+        au delà de k écarts-types, avec k le quantile de prunning_value, la masse d'une queue est sous le seuil et le premier noeud est prunné.
+        Un noeud de marge couvre le noeud prunné et son fils monomial, et une colonne ne s'élargit que d'un noeud par côté et par pas
+        '''
+        steps = np.arange(self.nb_steps + 1)
+        if not self.prunning_value:
+            return steps
+        p_down, p_up, _ = np.array(self.transition_probas).T
+        step_drift = p_up - p_down
+        drift = np.abs(np.append(0.0, np.cumsum(step_drift)))
+        variance = np.append(0.0, np.cumsum(p_up + p_down - step_drift ** 2))
+        k = -ndtri(self.prunning_value)
+        bound = np.ceil(drift + k * np.sqrt(variance)).astype(np.int64) + 1
+        return np.minimum(bound, steps)
+
+    @cached_property
+    def pruning_budget(self) -> float:
+        '''
+        Erreur de prix admise pour le prunning d'un côté du tronc dans une colonne : la tolérance est répartie sur les colonnes et les deux côtés
+        '''
+        return self.price_tolerance / (2 * self.nb_steps)
+
+    @cached_property
+    def _estimate_kind(self) -> tuple[int, bool, bool]:
+        '''
+        Signe (call +1, put -1), digitale et exerçable avant maturité : constantes de _tail_cut
+        '''
+        sign = 1 if isinstance(self.option, (CallOption, DigitalCallOption)) else -1
+        return sign, isinstance(self.option, (DigitalCallOption, DigitalPutOption)), bool(self.exercise_mask.any())
+
+    @cached_property
+    def smooth_last_step(self) -> bool:
+        '''
+        Lissage des vanilles : le dernier pas est remplacé par la formule fermée de Black-Scholes (pas pour les barrières, observées au dernier pas)
+        '''
+        return self.smoothing and isinstance(self.option, (CallOption, PutOption)) and self.knock is None
+
+    ''' --------------------------------------------------------------------------------------------------------------------------------- '''
+    '''                                              Section Mise à jour incrémentale                                                     '''
+    ''' --------------------------------------------------------------------------------------------------------------------------------- '''
+
+    def tracked_inputs(self) -> dict:
+        '''
+        Photographie des entrées du pricing (les dates d'exercice et les champs des dividendes sont copiés : listes et Dividend peuvent être modifiés sur place)
+        '''
+        option = self.option
+        return {"spot" : self.market.spot, "volatility" : self.market.volatility, "rate" : self.market.rate,
+                "dividende" : self.market.dividende, "div_date" : self.market.div_date,
+                "dividends" : tuple((dividend.date, dividend.amount, dividend.proportional) for dividend in self.market.dividends),
+                "rate_curve" : self._curve_snapshot(self.market.rate_curve), "vol_curve" : self._curve_snapshot(self.market.vol_curve),
+                "local_vol" : self._surface_snapshot(self.market.local_vol),
+                "time_to_maturity" : option.time_to_maturity, "start_date" : option.start_date,
+                "nb_steps" : self.nb_steps, "prunning_value" : self.prunning_value, "price_tolerance" : self.price_tolerance, "compact_nodes" : self.compact_nodes,
+                "option_type" : type(option), "strike" : option.strike, "coupon" : getattr(option, "coupon", None),
+                "exercise_dates" : tuple(getattr(option, "exercise_dates", ())), "smoothing" : self.smoothing,
+                "barrier" : getattr(option, "barrier", None), "direction" : getattr(option, "direction", None), "knock" : getattr(option, "knock", None),
+                "monitoring_dates" : tuple(getattr(option, "monitoring_dates", ())), "barrier_alignment" : self.barrier_alignment,
+                "instrument" : self.instrument, "instrument_memory" : self.instrument_memory}
+
+    @staticmethod
+    def _curve_snapshot(curve) -> tuple:
+        '''
+        Copie des piliers et valeurs d'une structure par terme (les listes peuvent être modifiées sur place)
+        '''
+        return None if curve is None else (tuple(curve.times), tuple(curve.values))
+
+    @staticmethod
+    def _surface_snapshot(surface) -> tuple:
+        '''
+        Copie de la grille d'une surface de volatilité locale
+        '''
+        return None if surface is None else (tuple(surface.times), tuple(surface.spots), tuple(map(tuple, surface.vols)))
+
+    def changed_inputs(self) -> set[str]:
+        '''
+        Entrées modifiées depuis la dernière génération par refresh_tree (toutes si l'arbre n'a pas été généré par refresh_tree)
+        '''
+        current = self.tracked_inputs()
+        if self.built_inputs is None:
+            return set(current)
+        return {name for name, value in current.items() if self.built_inputs[name] != value}
+
+    def invalidate_cache(self, names : list[str] = None, keep : tuple[str] = ()) -> None:
+        '''
+        Supprime les cached_property déjà calculées (toutes par défaut, sauf celles de keep) pour qu'elles soient recalculées avec les nouvelles entrées
+        '''
+        if names is None:
+            names = [name for klass in type(self).__mro__ for name, value in vars(klass).items() if isinstance(value, cached_property) and name not in keep]
+        for name in names:
+            self.__dict__.pop(name, None)
+
+    def refresh_tree(self) -> bool:
+        '''
+        Régénère l'arbre seulement si une entrée de la grille a changé, sinon n'invalide que les attributs liés au payoff.
+        Renvoie True si l'arbre a été régénéré
+        '''
+        changed = self.changed_inputs()
+        #Avec price_tolerance, la largeur de la grille dépend du payoff : toute modification impose de régénérer.
+        #Avec barrier_alignment, la grille est ancrée sur la barrière
+        regenerate = (bool(changed & LATTICE_INPUTS) or (bool(changed) and self.price_tolerance is not None)
+                      or ("barrier" in changed and self.barrier_alignment))
+        if regenerate:
+            self.invalidate_cache(keep=TIME_GRID_PROPERTIES if changed <= VOLATILITY_INPUTS else ())
+            self.generate_tree()
+        elif changed:
+            self.invalidate_cache(PAYOFF_PROPERTIES)
+        self.built_inputs = self.tracked_inputs()
+        return regenerate
+
+    def reprice(self) -> float:
+        '''
+        Price après modification des entrées (option, marché...) : seule la rétropropagation est refaite si la grille est encore valable
+        '''
+        self.refresh_tree()
+        return self.price()
+
     ''' --------------------------------------------------------------------------------------------------------------------------------- '''
     '''                                              Section Génération de l'arbre                                                        '''
     ''' --------------------------------------------------------------------------------------------------------------------------------- '''
 
+    @instrumented("Generate")
     def generate_tree(self):
         '''
         Fonction qui permet de générer l'abre colonne par colonne
         '''
         #Initialisation de la root avec le prix spot
-        self.root_node = Node(price = self.market.spot, node_proba = 1)
+        self.root_node = self.node_class(price = self.market.spot, node_proba = 1)
         mid_node = self.root_node
+        self.column_edges = (mid_node, mid_node)
         #On itère sur le tronc
         for step in range(1,self.nb_steps+1):
-            is_div = True if step == self.div_step else False
-            mid_node = self._build_column(mid_node, is_div)
+            dividend = self.dividend_steps.get(step)
+            if self.price_tolerance is not None:
+                self.column_cuts = self._column_cuts(mid_node, step - 1)
+            mid_node = self._build_column(mid_node, step - 1, dividend)
         #On enregistre la dernière node du tronc pour ne pas à avoir à reparcourir l'arbre pour le pricing
         self.last_node = mid_node
         
     
-    def _build_column(self, mid_node : Node, is_div : bool):
+    @cached_property
+    def _estimate_constants(self) -> list[tuple[float, float, float, float]]:
+        '''
+        Constantes de _tail_cut à chaque timeStep : facteur et montant des dividendes restants, strike actualisé et écart-type jusqu'à maturité
+        '''
+        remaining_rate, remaining_variance = self.remaining_integrals
+        discounted_strikes = (self.option.strike * np.exp(-remaining_rate)).tolist()
+        stds = np.sqrt(remaining_variance).tolist()
+        return [(*self._remaining_dividends(step), discounted_strikes[step], stds[step]) for step in range(self.nb_steps + 1)]
+
+    def _tail_cut(self, tail, step : int) -> tuple[int, float]:
+        '''
+        Parcourt les (prix, probabilité) d'un côté de la colonne du bord vers le tronc (exclu) : l'erreur du prunning (somme probabilité x valeur
+        jusqu'au bord) croît, on s'arrête au premier noeud où elle dépasse pruning_budget. La colonne précédente étant déjà prunnée, seuls
+        quelques noeuds sont évalués. Renvoie le nombre de noeuds prunnables et le prix du plus proche du tronc (None si aucun).
+        Valeur d'un noeud : européenne Black-Scholes sur la maturité restante (digitale : coupon actualisé x N(d2)),
+        bornée par l'exercice immédiat si l'option est exerçable
+        '''
+        factor, dividende, discounted_strike, std = self._estimate_constants[step]
+        sign, is_digital, is_exercisable = self._estimate_kind
+        option, budget = self.option, self.pruning_budget
+        error, count, cut = 0.0, 0, None
+        for price, proba in tail:
+            spot = price * factor - dividende
+            #Prix sous le dividende ou variance restante nulle : on garde le payoff
+            if spot <= 0 or std == 0:
+                value = option.payoff(price)
+            else:
+                d_2 = log(spot / discounted_strike) / std - std / 2
+                if is_digital:
+                    value = option.coupon * discounted_strike / option.strike * 0.5 * erfc(-sign * d_2 / SQRT_2)
+                else:
+                    value = sign * (spot * 0.5 * erfc(-sign * (d_2 + std) / SQRT_2) - discounted_strike * 0.5 * erfc(-sign * d_2 / SQRT_2))
+                if is_exercisable:
+                    value = max(value, option.payoff(price))
+            error += proba * value
+            if error > budget:
+                break
+            count, cut = count + 1, price
+        return count, cut
+
+    def _prunable(self, prices : np.ndarray, node_proba : np.ndarray, trunk : int, step : int) -> np.ndarray:
+        '''
+        Noeuds qui peuvent être prunnés (prix croissants, tronc à l'indice trunk) : probabilité sous prunning_value, ou avec price_tolerance,
+        erreur maximale du prunning à partir de ce noeud (somme probabilité x valeur de l'option jusqu'au bord de la colonne) sous pruning_budget.
+        La somme porte sur toute la queue : un noeud hors de la monnaie peut précéder des noeuds dans la monnaie
+        '''
+        if self.price_tolerance is None:
+            return node_proba <= self.prunning_value
+        size = len(prices)
+        nb_down, nb_up = self._tolerance_cuts(prices.item, node_proba, trunk, step)
+        prunable = np.zeros(size, dtype=bool)
+        prunable[:nb_down], prunable[size-nb_up:] = True, True
+        return prunable
+
+    def _tolerance_cuts(self, price, node_proba : np.ndarray, trunk : int, step : int) -> tuple[int, int]:
+        '''
+        Avec price_tolerance, nombre de noeuds prunnables sous et au dessus du tronc, comptés depuis chaque bord de la colonne.
+        price renvoie le prix du noeud d'indice donné : seuls les noeuds au bord sont lus
+        '''
+        proba = node_proba.item
+        nb_down, _ = self._tail_cut(((price(i), proba(i)) for i in range(trunk)), step)
+        nb_up, _ = self._tail_cut(((price(i), proba(i)) for i in range(len(node_proba) - 1, trunk, -1)), step)
+        return nb_down, nb_up
+
+    def _column_cuts(self, mid_node : Node, step : int) -> tuple[float, float]:
+        '''
+        Prix des premiers noeuds prunnés sous et au dessus du tronc (0 et inf si aucun), évalués une fois pour la colonne
+        en partant de ses noeuds extrêmes (column_edges, enregistrés à la génération de la colonne)
+        '''
+        bottom, top = self.column_edges
+
+        def tail(node, direction):
+            while node is not mid_node:
+                yield node.price, node.node_proba
+                node = node.up_node if direction == "up" else node.down_node
+
+        _, down_cut = self._tail_cut(tail(bottom, "up"), step)
+        _, up_cut = self._tail_cut(tail(top, "down"), step)
+        return (0 if down_cut is None else down_cut), (np.inf if up_cut is None else up_cut)
+
+    def _keeps_branching(self, node : Node, direction : str) -> bool:
+        '''
+        Vrai si le noeud a un branchement trinomial, faux au premier noeud prunné du côté du tronc considéré
+        '''
+        if self.price_tolerance is None:
+            return node.node_proba > self.prunning_value
+        down_cut, up_cut = self.column_cuts
+        return node.price < up_cut if direction == "up" else node.price > down_cut
+
+    def column_sizes(self) -> list[int]:
+        '''
+        Nombre de noeuds de chaque colonne, de la root à la maturité
+        '''
+        sizes = []
+        trunk_node = self.last_node
+        while trunk_node is not None:
+            sizes.append(len(self._column_nodes(trunk_node)))
+            trunk_node = trunk_node.prec_node
+        return sizes[::-1]
+
+    def _build_column(self, mid_node : Node, step : int, dividend : tuple[float, float]):
         '''
         Fonction qui génere une colonne de noeud
         '''
         #On construit le triplet depuis le tronc
-        self._build_triplet(mid_node, is_div)
+        self._build_triplet(mid_node, step, dividend)
 
         upper_node = mid_node.up_node
         down_node = mid_node.down_node
+        lowest_node, highest_node = mid_node, mid_node
 
         #En itérant vers le bas
         while down_node is not None:
-            down_node = self._compute_down_nodes(down_node, is_div)
+            lowest_node = down_node
+            down_node = self._compute_down_nodes(down_node, step, dividend)
             
          #En itérant vers le haut
         while upper_node is not None:
-            upper_node = self._compute_upper_nodes(upper_node, is_div)
-            
+            highest_node = upper_node
+            upper_node = self._compute_upper_nodes(upper_node, step, dividend)
+
+        #Noeuds extrêmes de la colonne générée : fils des noeuds extrêmes (mid si le noeud est prunné), point de départ de _column_cuts
+        self.column_edges = (lowest_node.next_down if lowest_node.next_down is not None else lowest_node.next_mid,
+                             highest_node.next_up if highest_node.next_up is not None else highest_node.next_mid)
         return mid_node.next_mid
 
-    def _build_triplet(self, node : Node, is_div : bool):
+    def _build_triplet(self, node : Node, step : int, dividend : tuple[float, float]):
         '''
         Génération des 3 noeuds fils depuis le noeud central à chaque colonne
         '''
-        node.next_mid = self.calculate_forward_node(node, is_div)
-        node.next_up = Node(price = node.next_mid.price * self.alpha)
-        node.next_down = Node(price = node.next_mid.price / self.alpha)
+        node.next_mid = self.calculate_forward_node(node, step, dividend)
+        node.next_up = self.node_class(price = node.next_mid.price * self.alpha)
+        node.next_down = self.node_class(price = node.next_mid.price / self.alpha)
         #Branchements des nouveaux noeuds entre eux
         node.branch_triplet()
         #On calcule les proba de transitions dans les états suivants
-        node.compute_transition_proba(self.alpha, self.time_delta, self.market, is_div, self.market.dividende)
+        self._set_transition_proba(node, step, dividend)
         #On calcule les proba d'existence des nouveaux noeuds
         node.update_proba()
 
-    def _find_mid(self, node: Node, candidate_mid: Node, direction: str) -> Node:
+    def _find_mid(self, node: Node, candidate_mid: Node, direction: str, step : int, dividend : tuple[float, float]) -> Node:
         '''
         Cherche le prochain noeud mid qui est le plus proche du prix forward dans les deux directions au moment du lachement du dividende
         '''
+        if self.instrument:
+            self.report.find_mid_searches += 1
         #Valeur attendue du forward
-        forward_value = node.price * exp(self.market.rate * self.time_delta) - self.market.dividende
+        forward_value = self._dividend_forward(node.price, step, dividend)
         while True:
             #On cherche vers le bas
             if direction == "down":
@@ -128,7 +579,7 @@ class Tree():
             if condition:
                 return candidate_mid
             else:
-                future_mid_node = Node(price=next_price)
+                future_mid_node = self.node_class(price=next_price)
                 if direction == "down":
                     future_mid_node.up_node = candidate_mid
                     candidate_mid.down_node = future_mid_node
@@ -138,25 +589,25 @@ class Tree():
 
                 candidate_mid = future_mid_node       
 
-    def _compute_upper_nodes(self, node : Node, is_div : bool) -> Node:
+    def _compute_upper_nodes(self, node : Node, step : int, dividend : tuple[float, float]) -> Node:
         '''
         Calcule la prochaine up nodes en prenant en compte le lachement du dividende et le prunning
         Symétrique à "_compute_down_nodes"
         '''
         #Trouver le prochain noeud mid si le dividendes tombent à ce timeStep
-        if is_div:
+        if dividend is not None:
             candidate_mid = node.down_node.next_up
-            node.next_mid = self._find_mid(node, candidate_mid, "up")
+            node.next_mid = self._find_mid(node, candidate_mid, "up", step, dividend)
             node.next_down = node.next_mid.down_node
         else:
             node.next_mid = node.down_node.next_up
             node.next_down = node.down_node.next_mid
 
         #Si pas de prunning : on créer le noeud down fils et on calcule les proba
-        if node.node_proba > self.prunning_value :
-            node.next_up = Node(price = node.next_mid.price * self.alpha)
+        if self._keeps_branching(node, "up"):
+            node.next_up = self.node_class(price = node.next_mid.price * self.alpha)
             #Calcul des proba de transition
-            node.compute_transition_proba(self.alpha, self.time_delta, self.market, is_div, self.market.dividende)
+            self._set_transition_proba(node, step, dividend)
             #Calcul des proba d'existance des noeuds fils
             node.update_proba()
             node.next_up.down_node = node.next_mid
@@ -166,17 +617,19 @@ class Tree():
         else :
             #If prunning : monomial branching = 100% proba mid
             node.branch_monomial()
+            if self.instrument:
+                self.report.pruned_nodes += 1
             return None
 
-    def _compute_down_nodes(self, node : Node, is_div : bool)-> Node:
+    def _compute_down_nodes(self, node : Node, step : int, dividend : tuple[float, float])-> Node:
         '''
         Calcule la prochaine down nodes en prenant en compte le lachement du dividende et le prunning
         Symétrique à "_compute_upper_nodes"
         '''
         #Trouver le prochain noeud mid si le dividendes tombent à ce timeStep
-        if is_div:
+        if dividend is not None:
             candidate_mid = node.up_node.next_down
-            node.next_mid = self._find_mid(node, candidate_mid, "down")
+            node.next_mid = self._find_mid(node, candidate_mid, "down", step, dividend)
             node.next_up = node.next_mid.up_node
             
         else:
@@ -184,10 +637,10 @@ class Tree():
             node.next_up = node.up_node.next_mid
 
         #Si pas de prunning : on créer le noeud down fils et on calcule les proba
-        if node.node_proba > self.prunning_value :
-            node.next_down = Node(price = node.next_mid.price / self.alpha)
+        if self._keeps_branching(node, "down"):
+            node.next_down = self.node_class(price = node.next_mid.price / self.alpha)
             #Calcul des proba de transition
-            node.compute_transition_proba(self.alpha, self.time_delta, self.market, is_div, self.market.dividende)
+            self._set_transition_proba(node, step, dividend)
 
             #Calcul des proba d'existance des noeuds fils
             node.update_proba()
@@ -199,42 +652,144 @@ class Tree():
         #Si prunning : branchement monomial
         else :
             node.branch_monomial()
+            if self.instrument:
+                self.report.pruned_nodes += 1
             return None
     
-    def calculate_forward_node(self, node : Node, is_div : bool) -> Node:
+    def _set_transition_proba(self, node : Node, step : int, dividend : tuple[float, float]) -> None:
+        '''
+        Affecte le triplet précalculé, le calcul par node n'est nécessaire qu'à la colonne du dividende et en volatilité locale
+        '''
+        if self.market.local_vol is not None:
+            #Variance interpolée sur la surface au prix du noeud, probabilités ramenées dans [0, 1] comme dans TreeVectorized
+            factor = dividend[0] if dividend is not None else 1.0
+            expectation = self._dividend_forward(node.price, step, dividend) if dividend is not None else node.price * self.growth_factors[step]
+            variance = (node.price * self.growth_factors[step] * factor) ** 2 * (exp(float(self._local_volatility(node.price, step)) ** 2 * self.time_delta) - 1)
+            p_down, p_up, _ = transition_proba(self.alpha, node.next_mid.price, expectation, variance)
+            node.set_transition_proba(tuple(map(float, clamp_transition_proba(self.alpha, node.next_mid.price, expectation, p_down, p_up))))
+        elif dividend is not None:
+            node.compute_transition_proba(self.alpha, self.growth_factors[step], self.variance_factors[step], dividend)
+        else:
+            node.set_transition_proba(self.transition_probas[step])
+
+    def calculate_forward_node(self, node : Node, step : int, dividend : tuple[float, float]) -> Node:
         '''
         Calcul du forward en fonction du dividende
         '''
-        if is_div:
-            forward_price = node.price * exp(self.market.rate * self.time_delta) - self.market.dividende
+        if dividend is not None:
+            forward_price = self._dividend_forward(node.price, step, dividend)
         else :
-            forward_price = node.price * exp(self.market.rate * self.time_delta)
-        return Node(price = forward_price)
+            forward_price = node.price * self.growth_factors[step]
+        #Tronc ancré sur la grille de la barrière : l'écart au forward est pris en compte dans transition_probas (ou au dividende dans les probabilités par node)
+        if self.barrier_alignment:
+            forward_price = self._barrier_anchor(forward_price)
+        return self.node_class(price = forward_price)
 
     ''' --------------------------------------------------------------------------------------------------------------------------------- '''
     '''                                              Section pricing de l'option                                                          '''
     ''' --------------------------------------------------------------------------------------------------------------------------------- '''
 
-    def price(self) -> None:
+    @instrumented("Price")
+    def price(self) -> float:
+        '''
+        Pricer l'option avec l'arbre par mouvement backward, renvoie le prix (payoff de la root).
+        Knock-in : une première passe vanille garde les colonnes observées, reprises aux noeuds qui franchissent la barrière
+        '''
+        if self.knock == "in":
+            vanilla = {}
+            self._backward_pass(record = vanilla)
+            return self._backward_pass(vanilla = vanilla)
+        return self._backward_pass()
+
+    def _backward_pass(self, vanilla : dict = None, record : dict = None) -> float:
         '''
-        Pricer l'option avec l'arbre par mouvement backward
+        Rétropropagation de la dernière colonne à la root. vanilla : colonnes observées de la vanille (passe knock-in),
+        record : dictionnaire où garder ces colonnes (passe vanille d'un knock-in, sans masque)
         '''
         last_node = self.last_node
-        #Calcul du payoff de la dernière colonne
+        #Calcul du payoff de la dernière colonne (nul avant activation d'un knock-in)
         self._compute_final_payoff(last_node)
+        if vanilla is not None:
+            self._set_column_payoffs(last_node, np.zeros(len(self._column_nodes(last_node))))
+        if self.barrier_mask[self.nb_steps]:
+            self._barrier_column(last_node, self.nb_steps, vanilla, record)
         step = self.nb_steps - 1
         trunc_node = last_node.prec_node
 
+        #Lissage : valeur Black-Scholes sur le dernier pas au lieu de la rétropropagation
+        if self.smooth_last_step and trunc_node is not None:
+            self._set_column_payoffs(trunc_node, self._smoothed_last_step(np.array([node.price for node in self._column_nodes(trunc_node)]), step))
+            trunc_node = trunc_node.prec_node
+            step-=1
+
         #Itération sur les noeuds du tronc en backward
         while trunc_node is not None:
-            self._retro_payoff(trunc_node, step)
+            self._retro_payoff(trunc_node, step, vanilla, record)
             trunc_node = trunc_node.prec_node
             step-=1
+        return self.root_node.payoff
+
+    def _column_nodes(self, trunc_node : Node) -> list[Node]:
+        '''
+        Liste des noeuds d'une colonne, du tronc vers le haut puis vers le bas
+        '''
+        nodes = []
+        this_up = trunc_node
+        while this_up is not None:
+            nodes.append(this_up)
+            this_up = this_up.up_node
+        this_down = trunc_node.down_node
+        while this_down is not None:
+            nodes.append(this_down)
+            this_down = this_down.down_node
+        return nodes
+
+    def _set_column_payoffs(self, trunc_node : Node, payoffs : np.ndarray) -> None:
+        '''
+        Affecte les payoffs calculés sur toute la colonne (dans l'ordre de _column_nodes)
+        '''
+        for node, payoff in zip(self._column_nodes(trunc_node), payoffs):
+            node.payoff = float(payoff)
+
+    def _smoothed_final_payoffs(self, prices : np.ndarray) -> np.ndarray:
+        '''
+        Payoff digital moyenné sur l'intervalle de prix de chaque noeud, [S/sqrt(alpha), S*sqrt(alpha)] en log-prix
+        '''
+        share_above = np.clip(np.log(prices / self.option.strike) / log(self.alpha) + 0.5, 0, 1)
+        if isinstance(self.option, DigitalCallOption):
+            return self.option.coupon * share_above
+        return self.option.coupon * (1 - share_above)
+
+    def _final_payoffs(self, prices : np.ndarray) -> np.ndarray:
+        '''
+        Payoffs de la dernière colonne, lissés pour les digitales si smoothing
+        '''
+        if self.smoothing and isinstance(self.option, (DigitalCallOption, DigitalPutOption)):
+            return self._smoothed_final_payoffs(prices)
+        return self.option.payoff_vector(prices)
+
+    def _smoothed_last_step(self, prices : np.ndarray, step : int) -> np.ndarray:
+        '''
+        Valeur au timeStep N-1 donnée par Black-Scholes (européenne de maturité time_delta), avec l'exercice anticipé si besoin
+        '''
+        factor, dividende = self.dividend_steps.get(self.nb_steps, (1.0, 0.0))
+        #Taux et volatilité du dernier pas (structures par terme)
+        rate, volatility = self.rate_integrals[-1] / self.time_delta, sqrt(self.variance_integrals[-1] / self.time_delta)
+        if self.market.local_vol is not None:
+            volatility = self._local_volatility(prices, step)
+        values = black_scholes_price(prices * factor, self.option.strike, self.time_delta, volatility, rate, dividende, isinstance(self.option, CallOption))
+        if self.exercise_mask[step]:
+            values = np.maximum(values, self.option.payoff_vector(prices))
+        return values
 
     def _compute_final_payoff(self, trunc_node : Node) -> None: 
         '''
         Calcule le payoff de l'option sur la dernière colonne
         '''       
+        if self.smoothing and isinstance(self.option, (DigitalCallOption, DigitalPutOption)):
+            self._set_column_payoffs(trunc_node, self._final_payoffs(np.array([node.price for node in self._column_nodes(trunc_node)])))
+            return
+
         this_up = trunc_node
         this_down = trunc_node
 
@@ -248,19 +803,68 @@ class Tree():
             this_down.payoff = self.option.payoff(this_down.price)
             this_down = this_down.down_node
 
-    def _retro_payoff(self, trunc_node : Node, step : int) -> None:
+    def _retro_payoff(self, trunc_node : Node, step : int, vanilla : dict = None, record : dict = None) -> None:
         '''
-        Calcule le prix de l'option sur la colonne par rétropropagation
+        Calcule le prix de l'option sur la colonne par rétropropagation, puis applique le masque de barrière si la colonne est observée
         '''
         this_up = trunc_node
         this_down = trunc_node
+        #Exercice et actualisation évalués une fois pour toute la colonne (pas d'exercice d'un knock-in avant son activation)
+        is_exercise = bool(self.exercise_mask[step]) and vanilla is None
+        discount = self.discount_factors[step]
 
         #Itération vers les noeuds supérieurs
         while this_up is not None:
-            this_up.node_payoff(step, self.option, self.exercise_steps, self.market.rate, self.time_delta)
+            this_up.node_payoff(self.option, is_exercise, discount)
             this_up = this_up.up_node
 
         #Itération vers les noeuds inférieurs
         while this_down is not None:
-            this_down.node_payoff(step, self.option, self.exercise_steps, self.market.rate, self.time_delta)
-            this_down =this_down.down_node
\ No newline at end of file
+            this_down.node_payoff(self.option, is_exercise, discount)
+            this_down =this_down.down_node
+
+        if self.barrier_mask[step]:
+            self._barrier_column(trunc_node, step, vanilla, record)
+
+    def _barrier_column(self, trunc_node : Node, step : int, vanilla : dict = None, record : dict = None) -> None:
+        '''
+        Masque de barrière appliqué à toute la colonne en une opération (voir _knock) : 0 pour un knock-out, valeur de la vanille pour un knock-in.
+        Pendant la passe vanille d'un knock-in, la colonne est seulement gardée dans record
+        '''
+        nodes = self._column_nodes(trunc_node)
+        payoffs = np.array([node.payoff for node in nodes])
+        if record is not None:
+            record[step] = payoffs
+            return
+        payoffs = self._knock(payoffs, np.array([node.price for node in nodes]), vanilla[step] if vanilla is not None else 0.0)
+        for node, payoff in zip(nodes, payoffs):
+            node.payoff = float(payoff)
+
+    def price_richardson(self) -> dict:
+        '''
+        Extrapolation de Richardson sur des arbres lissés à N/2, N et 2N pas (le lissage est activé sur l'arbre : sans lui l'erreur change de signe avec N).
+        2*P(2N) - P(N) n'est retenu que si la convergence est monotone en 1/N : écarts successifs de même signe, le second proche de la moitié
+        du premier. Sinon le prix de la grille la plus fine est renvoyé. L'écart |P(2N) - P(N)| sert d'estimation de l'erreur
+        '''
+        #L'arbre lui-même passe par refresh_tree (cache et built_inputs à jour pour les repricings suivants), son lissage est rétabli à la fin
+        smoothing, self.smoothing = self.smoothing, True
+        prices, times = [], []
+        try:
+            for nb_steps in (max(self.nb_steps // 2, 1), self.nb_steps, 2 * self.nb_steps):
+                tree = self if nb_steps == self.nb_steps else replace(self, nb_steps = nb_steps, built_inputs = None)
+                start = time.time()
+                if tree is self:
+                    tree.refresh_tree()
+                else:
+                    tree.generate_tree()
+                prices.append(tree.price())
+                times.append(time.time() - start)
+        finally:
+            self.smoothing = smoothing
+
+        price_half, price_coarse, price_fine = prices
+        ratio = (price_fine - price_coarse) / (price_coarse - price_half) if price_coarse != price_half else 0.0
+        is_extrapolated = 0.3 <= ratio <= 0.7
+        price = 2 * price_fine - price_coarse if is_extrapolated else price_fine
+        return {"Price" : price, "Error Estimate" : abs(price_fine - price_coarse), "Extrapolated" : is_extrapolated,
+                "Price N/2" : price_half, "Price N" : price_coarse, "Price 2N" : price_fine, "Time N/2" : times[0], "Time N" : times[1], "Time 2N" : times[2]}
@@ -1,200 +1,208 @@
-from math import exp, sqrt, ceil
-from typing import Union
-from tqdm import tqdm
-from dataclasses import dataclass
-from functools import cached_property
-from PythonFiles.market import Market
-from PythonFiles.node import Node
-from PythonFiles.options import EuropeanCallOption, EuropeanPutOption, AmericanCallOption, AmericanPutOption, BermudeanCallOption, BermudeanPutOption
+from dataclasses import dataclass, field
+import numpy as np
+from PythonFiles.treeVectorized import TreeVectorized, Column
+from PythonFiles.instrumentation import instrumented
 
 @dataclass
-class TreeMemoryAlloc():
-   
-    option : Union[EuropeanCallOption, EuropeanPutOption, AmericanCallOption, AmericanPutOption, BermudeanCallOption, BermudeanPutOption]
-    market : Market
-    nb_steps : int
-    root_node : Node = None
-    prunning_value : float = None
-
-    @cached_property
-    def time_delta(self) -> float:
-        return self.option.time_to_maturity / self.nb_steps    
-
-    @cached_property
-    def alpha(self) -> float:
-        return exp(self.market.volatility * sqrt(3 * self.time_delta)  )
-
-    @cached_property
-    def div_step(self) -> float:
-        if self.market.dividende <= 0:
-            return -1
-        else:
-            time_delta_in_days = self.time_delta * 356
-            return ceil((self.market.div_date - self.option.start_date).days/time_delta_in_days)
-
-    @cached_property
-    def exercise_steps(self) -> list[int]:
-
-        if isinstance(self.option, BermudeanCallOption) or isinstance(self.option, BermudeanPutOption):
-            exercise_dates = self.option.exercise_dates
-            time_delta_in_days = self.time_delta * 356
-            return [ceil((ex_date - self.option.start_date).days/time_delta_in_days) for ex_date in exercise_dates]
-        
-        elif isinstance(self.option, AmericanCallOption) or isinstance(self.option, AmericanPutOption):
-            return [i for i in range(self.nb_steps)]
-        
-        else:
-            return []
-
-            
-    def price_tree(self):
-
-        self.root_node = Node(price = self.market.spot)
-        mid_node = self.root_node
-        
-        #On  génère l'arbre avec seulement les noeuds mid
-        for _ in range(self.nb_steps):
-            mid_node.next_mid =self.calculate_forward_node(mid_node, is_div=False)
-            mid_node.next_mid.prec_node = mid_node
-            mid_node = mid_node.next_mid
-
-        print("Fin de la génération de l'arbre")
-        # On compute les prices et payoff sur le dernier noeud
-        k =int(6*sqrt(self.nb_steps/3))
-        self._compute_last_payoff(mid_node, k)
-        print("Fin de la comput des derniers payoffs")
-        for i in tqdm(range(self.nb_steps-1,-1,-1), total=self.nb_steps, desc="Building tree...", leave=False):
-            mid_node = mid_node.prec_node
-            k = int(min(i, 6*sqrt(i/3)))
-            self._compute_mid_node(mid_node, i)
-            self._compute_upper_nodes(mid_node,k, i)
-            self._compute_down_nodes(mid_node,k, i)
-            self._destroy_nodes(mid_node.next_mid)
-
-        return mid_node.payoff
-
-    def _compute_last_payoff(self, node : Node, k : int):
-        node.payoff = self.option.payoff(node.price)
-        node_up  = node
-        node_down = node
-        
-        for _ in range(k):
-            node_down.down_node = Node(price = node_down.price / self.alpha)
-            node_down.down_node.up_node = node_down
-            node_down = node_down.down_node
-            node_down.payoff = self.option.payoff(node_down.price)
-        
-        for _ in range(k):    
-            node_up.up_node = Node(price = node_up.price * self.alpha)
-            node_up.up_node.down_node = node_up
-            node_up = node_up.up_node
-            node_up.payoff = self.option.payoff(node_up.price)
-    
-    '''
-    Permet de calculer les payoffs des noeuds du milieu
+class TreeMemoryAlloc(TreeVectorized):
     '''
-    def _compute_mid_node(self, node:Node, i:int):
-        node.next_up = node.next_mid.up_node
-        node.next_down = node.next_mid.down_node
-        node.compute_transition_proba(alpha = self.alpha, time_delta = self.time_delta, market = self.market, dividende = self.market.dividende, is_div = False)
-        node.node_payoff(i, self.option, self.exercise_steps, self.market.rate, self.time_delta)
-    
+    Pricer en flux : seules deux colonnes (courante et suivante) sont gardées en mémoire.
+    La passe forward n'enregistre que la géométrie de chaque colonne (O(N) entiers), la passe backward
+    reconstruit prix et transitions à la volée dans deux buffers recyclés
     '''
-    Calcul des payoff des noeuds du haut
-    '''
-    def _compute_upper_nodes(self, node:Node,k:int, i:int):
-        for _ in range(k):
-            # On cree le noeud de haut dessus
-            node.up_node = Node(price = node.price * self.alpha)
-            node.up_node.down_node = node
-            node = node.up_node
-            # On relie 
-            node.next_mid = node.down_node.next_up
-            node.next_down = node.down_node.next_mid
-            node.next_up = node.next_mid.up_node
-            # On calcule les proba et les payoff
-            if (node.next_up is None):
-                node.p_mid = 1.0
-                node.p_down = 0.0
-                node.p_up = 0.0
-            else:
-                node.compute_transition_proba(alpha = self.alpha, time_delta = self.time_delta, market = self.market, dividende = self.market.dividende, is_div = False)
-            
-            node.node_payoff(i, self.option, self.exercise_steps, self.market.rate, self.time_delta)
+    trunk_prices : np.ndarray = None
+    trunks : np.ndarray = None
+    sizes : np.ndarray = None
+    bottoms : np.ndarray = None
+    tops : np.ndarray = None
+    pruned_downs : np.ndarray = None
+    pruned_ups : np.ndarray = None
+    div_transitions : dict = field(default_factory=dict)
+
+    def price_tree(self) -> float:
+        '''
+        Génère la géométrie de l'arbre puis price l'option
+        '''
+        self.generate_tree()
+        return self.price()
 
-    '''
-    Permet de calculer les payoffs des noeuds du bas
-    '''
-    def _compute_down_nodes(self, node:Node,k:int, i:int):
-        for _ in range(k):
-            # On cree le noeud de haut dessus
-            node.down_node = Node(price = node.price / self.alpha)
-            node.down_node.up_node = node
-            node = node.down_node
-            # On relie 
-            node.next_mid = node.up_node.next_down
-            node.next_up = node.up_node.next_mid
-            node.next_down = node.next_mid.down_node
-            # On calcule les proba et les payoff
-            if (node.next_down is None):
-                node.p_mid = 1.0
-                node.p_down = 0.0
-                node.p_up = 0.0
+    ''' --------------------------------------------------------------------------------------------------------------------------------- '''
+    '''                                              Section Génération de l'arbre                                                        '''
+    ''' --------------------------------------------------------------------------------------------------------------------------------- '''
+
+    @instrumented("Generate")
+    def generate_tree(self) -> None:
+        '''
+        Passe forward sur les probabilités d'existence pour déterminer le prunning de chaque colonne
+        '''
+        if self.precision != "float64":
+            raise ValueError("TreeMemoryAlloc ne garde que deux colonnes, calculées en float64 : precision n'est disponible qu'avec TreeVectorized")
+        nb_steps = self.nb_steps
+        self.trunk_prices = np.empty(nb_steps + 1)
+        self.trunks = np.zeros(nb_steps + 1, dtype=np.int64)
+        self.sizes = np.ones(nb_steps + 1, dtype=np.int64)
+        self.bottoms = np.zeros(nb_steps, dtype=np.int64)
+        self.tops = np.zeros(nb_steps, dtype=np.int64)
+        self.pruned_downs = np.zeros(nb_steps, dtype=bool)
+        self.pruned_ups = np.zeros(nb_steps, dtype=bool)
+        self.div_transitions = {}
+
+        #Buffers dimensionnés d'emblée par la borne analytique de largeur : ils ne sont agrandis que si le dividende
+        #ou price_tolerance élargissent une colonne au delà
+        capacity = 2 * int(self.width_bound[-1]) + 1 if self.price_tolerance is None else 64
+        proba, next_proba = np.zeros(capacity), np.zeros(capacity)
+        proba[0] = 1.0
+        self.trunk_prices[0] = self.market.spot
+
+        for step in range(nb_steps):
+            dividend = self.dividend_steps.get(step + 1)
+            #Seules les colonnes du dividende sont irrégulières : en volatilité locale la géométrie reste régulière,
+            #les probabilités de chaque noeud sont recalculées à partir des prix de la colonne (voir _regular_probas)
+            is_div = dividend is not None
+            trunk, size = int(self.trunks[step]), int(self.sizes[step])
+            #Les prix ne sont reconstruits que pour les colonnes du dividende (le prunning par tolérance ne lit que les noeuds au bord, voir _price_at)
+            column = Column(prices = None, node_proba = proba[:size], trunk = trunk, step = step)
+            bottom, top, pruned_down, pruned_up = self._active_bounds(column)
+            self.bottoms[step], self.tops[step] = bottom, top
+            self.pruned_downs[step], self.pruned_ups[step] = pruned_down, pruned_up
+
+            if is_div:
+                #Colonne irrégulière (recentrage au dividende) : on garde ses transitions, une seule colonne en mémoire
+                if column.prices is None:
+                    column.prices = self._column_prices(step)
+                next_column = self._build_column(column, dividend)
+                self.div_transitions[step] = (column.next_mid, column.p_up, column.p_mid, column.p_down)
+                next_size, next_trunk = len(next_column.prices), next_column.trunk
+                self.trunk_prices[step + 1] = next_column.prices[next_trunk]
             else:
-                node.compute_transition_proba(alpha = self.alpha, time_delta = self.time_delta, market = self.market, dividende = self.market.dividende, is_div = False)
-
-            node.node_payoff(i, self.option, self.exercise_steps, self.market.rate, self.time_delta)
-
-    def _destroy_nodes(self, node: Node):
-        '''
-        Fonction qui va détruire les noeuds
-        '''
-        node_up = node.up_node
-        node_down = node.down_node
-
-        # Détruire les nœuds au-dessus
-        while node_up is not None:
-            if node_up.down_node is not None:
-                node_up.down_node.up_node = None
-            node_up.down_node = None
-            node_up.next_mid = None
-            node_up.next_down = None
-            node_up.next_up = None
-            next_node_up = node_up.up_node
-            node_up.up_node = None
-            node_up = next_node_up
-
-        # Détruire les nœuds en dessous
-        while node_down is not None:
-            if node_down.up_node is not None:
-                node_down.up_node.down_node = None
-            node_down.up_node = None
-            node_down.next_mid = None
-            node_down.next_down = None
-            node_down.next_up = None
-            next_node_down = node_down.down_node
-            node_down.down_node = None
-            node_down = next_node_down
-
-        # Finalement, détruire le nœud principal
-        node.up_node = None
-        node.down_node = None
-        node.next_mid = None
-        node.next_down = None
-        node.next_up = None
-        node = None
-        
-    def calculate_forward_node(self, node : Node, is_div : bool) -> Node:
-        '''
-        Calcul du forward en fonction du dividende
-        '''
-        if is_div:
-            forward_price = node.price * exp(self.market.rate * self.time_delta) - self.market.dividende
-        else :
-            forward_price = node.price * exp(self.market.rate * self.time_delta)
-        return Node(price = forward_price)
-            
-
-
-
-    
\ No newline at end of file
+                if self.instrument:
+                    self.report.pruned_nodes += pruned_down + pruned_up
+                lowest = bottom - trunk - (0 if pruned_down else 1)
+                highest = top - trunk + (0 if pruned_up else 1)
+                next_size, next_trunk = highest - lowest + 1, -lowest
+                self.trunk_prices[step + 1] = self.trunk_prices[step] * self.growth_factors[step]
+                if self.barrier_alignment:
+                    self.trunk_prices[step + 1] = self._barrier_anchor(self.trunk_prices[step + 1])
+
+            #Agrandissement des deux buffers si la colonne suivante dépasse leur capacité
+            if next_size > capacity:
+                capacity = 2 * next_size
+                proba, next_proba = np.concatenate((proba, np.zeros(capacity - len(proba)))), np.zeros(capacity)
+            if is_div:
+                next_proba[:next_size] = next_column.node_proba
+            else:
+                self._propagate_proba(proba, next_proba[:next_size], bottom, top, pruned_down, pruned_up, next_trunk - trunk, step)
+
+            self.trunks[step + 1], self.sizes[step + 1] = next_trunk, next_size
+            proba, next_proba = next_proba, proba
+
+    def column_sizes(self) -> list[int]:
+        '''
+        Nombre de noeuds de chaque colonne, lu dans la géométrie enregistrée
+        '''
+        return self.sizes.tolist()
+
+    def _propagate_proba(self, proba : np.ndarray, next_proba : np.ndarray, bottom : int, top : int, pruned_down : bool, pruned_up : bool, shift : int, step : int) -> None:
+        '''
+        Diffuse les probabilités d'existence d'une colonne sans dividende vers la suivante (noeud mid = même indice décalé de shift)
+        '''
+        first, last = bottom + pruned_down, top - pruned_up
+        p_down, p_up, p_mid = self._regular_probas(step, first, last)
+        block = proba[first:last+1]
+        next_proba[:] = 0
+        next_proba[first+shift+1:last+shift+2] += block * p_up
+        next_proba[first+shift:last+shift+1] += block * p_mid
+        next_proba[first+shift-1:last+shift] += block * p_down
+        #Branchement monomial des noeuds prunnés
+        if pruned_down:
+            next_proba[bottom+shift] += proba[bottom]
+        if pruned_up:
+            next_proba[top+shift] += proba[top]
+
+    def _regular_probas(self, step : int, first : int, last : int) -> tuple:
+        '''
+        Probabilités de transition des noeuds first..last d'une colonne sans dividende : triplet du pas, ou en volatilité locale
+        probabilités de chaque noeud recalculées depuis les prix de la colonne (rien n'est gardé d'un pas à l'autre)
+        '''
+        if self.market.local_vol is None:
+            return self.transition_probas[step]
+        return self._local_vol_probas(self._column_prices(step)[first:last+1], step)
+
+    def _price_at(self, column : Column):
+        '''
+        Prix d'un noeud reconstruit à partir du prix du tronc, sans construire la colonne
+        '''
+        if column.prices is not None:
+            return column.prices.item
+        trunk_price, alpha, trunk = float(self.trunk_prices[column.step]), self.alpha, column.trunk
+        return lambda index: trunk_price * alpha ** (index - trunk)
+
+    def _column_prices(self, step : int) -> np.ndarray:
+        '''
+        Reconstruit les prix d'une colonne à partir du prix du tronc
+        '''
+        relative = np.arange(self.sizes[step]) - self.trunks[step]
+        return self.trunk_prices[step] * self.alpha ** relative
+
+    ''' --------------------------------------------------------------------------------------------------------------------------------- '''
+    '''                                              Section pricing de l'option                                                          '''
+    ''' --------------------------------------------------------------------------------------------------------------------------------- '''
+
+    @instrumented("Price")
+    def price(self) -> float:
+        '''
+        Rétropropagation avec deux buffers recyclés d'une colonne à l'autre. Knock-in : la vanille est rétropropagée dans la même boucle
+        (deux buffers de plus) et reprise aux noeuds qui franchissent la barrière
+        '''
+        knock = self.knock
+        exercise_mask = self.exercise_mask
+        barrier_mask = self.barrier_mask
+        capacity = int(self.sizes.max())
+        values, next_values = np.zeros(capacity), np.zeros(capacity)
+        final_size, final_prices = int(self.sizes[-1]), self._column_prices(self.nb_steps)
+        next_values[:final_size] = self._final_payoffs(final_prices)
+        if knock == "in":
+            #Valeur nulle avant activation, la vanille garde le payoff
+            vanilla, next_vanilla = np.zeros(capacity), next_values.copy()
+            next_values[:final_size] = 0
+        if barrier_mask[-1]:
+            next_values[:final_size] = self._knock(next_values[:final_size], final_prices, next_vanilla[:final_size] if knock == "in" else 0.0)
+        last_step = self.nb_steps - 1
+        if self.smooth_last_step and last_step >= 0:
+            next_values[:self.sizes[last_step]] = self._smoothed_last_step(self._column_prices(last_step), last_step)
+            last_step -= 1
+
+        for step in range(last_step, -1, -1):
+            size = int(self.sizes[step])
+            current = values[:size]
+            self._roll_back(step, next_values, current)
+            if knock == "in":
+                #Pas d'exercice du knock-in avant activation : seule la vanille est exercée
+                self._roll_back(step, next_vanilla, vanilla[:size])
+                if exercise_mask[step]:
+                    np.maximum(vanilla[:size], self.option.payoff_vector(self._column_prices(step)), out=vanilla[:size])
+                vanilla, next_vanilla = next_vanilla, vanilla
+            elif exercise_mask[step]:
+                np.maximum(current, self.option.payoff_vector(self._column_prices(step)), out=current)
+            if barrier_mask[step]:
+                current[:] = self._knock(current, self._column_prices(step), next_vanilla[:size] if knock == "in" else 0.0)
+            values, next_values = next_values, values
+
+        self.root_price = float(next_values[0])
+        return self.root_price
+
+    def _roll_back(self, step : int, next_values : np.ndarray, current : np.ndarray) -> None:
+        '''
+        Valeur de continuation actualisée d'une colonne à partir des valeurs de la colonne suivante (transitions gardées ou géométrie régulière)
+        '''
+        discount = self.discount_factors[step]
+        if step in self.div_transitions:
+            next_mid, column_p_up, column_p_mid, column_p_down = self.div_transitions[step]
+            next_size = int(self.sizes[step + 1])
+            up, down = np.minimum(next_mid + 1, next_size - 1), np.maximum(next_mid - 1, 0)
+            current[:] = (column_p_up * next_values[up] + column_p_mid * next_values[next_mid] + column_p_down * next_values[down]) * discount
+        else:
+            bottom, top = int(self.bottoms[step]), int(self.tops[step])
+            pruned_down, pruned_up = bool(self.pruned_downs[step]), bool(self.pruned_ups[step])
+            bounds = (bottom, top, pruned_down, pruned_up, int(self.trunks[step + 1] - self.trunks[step]))
+            self._regular_roll_back(step, bounds, self._regular_probas(step, bottom + pruned_down, top - pruned_up), next_values, current)
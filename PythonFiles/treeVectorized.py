@@ -0,0 +1,320 @@
+from math import log
+from dataclasses import dataclass, field, replace
+import numpy as np
+from PythonFiles.node import transition_proba, clamp_transition_proba
+from PythonFiles.tree import Tree
+from PythonFiles.options import BarrierOption
+from PythonFiles.instrumentation import instrumented
+
+@dataclass
+class Column():
+    '''
+    Colonne de l'arbre stockée sous forme de tableaux contigus (une case par noeud, du bas vers le haut)
+    '''
+    prices : np.ndarray
+    node_proba : np.ndarray
+    trunk : int
+    step : int = 0
+
+    #Transitions noeud par noeud, gardées seulement quand les probabilités varient d'un noeud à l'autre (dividende, volatilité locale)
+    next_mid : np.ndarray = None
+    p_up : np.ndarray = None
+    p_mid : np.ndarray = None
+    p_down : np.ndarray = None
+    #Colonne régulière : géométrie (bottom, top, pruned_down, pruned_up, décalage du mid) et triplet du pas suffisent à la rétropropagation
+    bounds : tuple[int, int, bool, bool, int] = None
+
+    payoff : np.ndarray = None
+
+def stack_options(options : list) -> object:
+    '''
+    Regroupe des options d'une même classe en une seule instance dont strike (et coupon) sont des vecteurs colonnes :
+    payoff_vector renvoie alors directement la matrice (options x noeuds)
+    '''
+    first = options[0]
+    stacked_fields = {name : np.array([getattr(option, name) for option in options], dtype=float)[:, None] for name in ("strike", "coupon") if hasattr(first, name)}
+    return replace(first, **stacked_fields)
+
+@dataclass
+class TreeVectorized(Tree):
+    '''
+    Arbre trinomial dont chaque colonne est stockée en tableaux numpy : même sémantique que Tree
+    (prunning, recentrage au dividende, exercise_steps) mais la rétropropagation se fait colonne par colonne
+    '''
+    columns : list[Column] = field(default_factory=list)
+    root_price : float = None
+    #Précision de stockage des prix et des valeurs des colonnes ("float64" ou "float32") : géométrie, probabilités et sommes de la
+    #rétropropagation restent en float64, l'écart de prix reste de l'ordre de l'arrondi float32 des prix (sans accumulation avec le nombre de pas).
+    #Hors dividende et volatilité locale, prix et valeurs sont les seuls tableaux gardés par noeud : float32 divise leur mémoire par deux
+    precision : str = "float64"
+
+    ''' --------------------------------------------------------------------------------------------------------------------------------- '''
+    '''                                              Section Génération de l'arbre                                                        '''
+    ''' --------------------------------------------------------------------------------------------------------------------------------- '''
+
+    @instrumented("Generate")
+    def generate_tree(self) -> None:
+        '''
+        Génère l'arbre colonne par colonne à partir du spot
+        '''
+        column = Column(prices = np.array([float(self.market.spot)]), node_proba = np.array([1.0]), trunk = 0)
+        self.columns = [column]
+        for step in range(1, self.nb_steps+1):
+            column = self._build_column(column, self.dividend_steps.get(step))
+            #Les prix de la colonne précédente ne servent plus à la génération : stockés dans la précision choisie,
+            #les probabilités d'existence ne servent qu'au prunning de la colonne suivante
+            self.columns[-1].prices = self.columns[-1].prices.astype(self.precision, copy=False)
+            self.columns[-1].node_proba = None
+            self.columns.append(column)
+        column.prices = column.prices.astype(self.precision, copy=False)
+
+    def column_sizes(self) -> list[int]:
+        '''
+        Nombre de noeuds de chaque colonne, de la root à la maturité
+        '''
+        return [len(column.prices) for column in self.columns]
+
+    def _active_bounds(self, column : Column) -> tuple[int, int, bool, bool]:
+        '''
+        Renvoie les positions extrêmes des noeuds qui ont des fils : on s'arrête au premier noeud prunné de chaque côté du tronc
+        '''
+        proba = column.node_proba
+        trunk = column.trunk
+        if self.price_tolerance is not None:
+            #Prunning par tolérance : les bornes se déduisent directement du nombre de noeuds prunnables de chaque bord
+            nb_down, nb_up = self._tolerance_cuts(self._price_at(column), proba, trunk, column.step)
+            bottom, pruned_down = (nb_down - 1, True) if nb_down > 0 else (0, False)
+            top, pruned_up = (len(proba) - nb_up, True) if nb_up > 0 else (len(proba) - 1, False)
+            return bottom, top, pruned_down, pruned_up
+        prunable = self._prunable(column.prices, proba, trunk, column.step)
+        pruned_below = np.flatnonzero(prunable[:trunk][::-1])
+        pruned_above = np.flatnonzero(prunable[trunk+1:])
+        if pruned_below.size > 0:
+            bottom, pruned_down = trunk - 1 - pruned_below[0], True
+        else:
+            bottom, pruned_down = 0, False
+        if pruned_above.size > 0:
+            top, pruned_up = trunk + 1 + pruned_above[0], True
+        else:
+            top, pruned_up = len(proba) - 1, False
+        return int(bottom), int(top), pruned_down, pruned_up
+
+    def _price_at(self, column : Column):
+        '''
+        Prix d'un noeud de la colonne à partir de son indice
+        '''
+        return column.prices.item
+
+    def _find_mids(self, forwards : np.ndarray, next_trunk_price : float, trunk : int) -> np.ndarray:
+        '''
+        Indices (relatifs au tronc suivant) des noeuds mid au détachement du dividende, équivalent vectoriel de Tree._find_mid
+        '''
+        if self.instrument:
+            self.report.find_mid_searches += len(forwards) - 1
+        log_alpha = log(self.alpha)
+        ratio = forwards / next_trunk_price
+        #Plus grand indice dont le milieu avec le noeud inférieur est sous le forward (recherche vers le bas)
+        natural_down = np.ceil(np.log(2 * ratio / (1 + 1/self.alpha)) / log_alpha).astype(np.int64) - 1
+        #Plus petit indice dont le milieu avec le noeud supérieur est au dessus du forward (recherche vers le haut)
+        natural_up = np.floor(np.log(2 * ratio / (1 + self.alpha)) / log_alpha).astype(np.int64) + 1
+
+        #Tree._find_mid part du noeud voisin du mid précédent : les mids restent strictement monotones
+        relative = np.arange(len(forwards)) - trunk
+        mids = np.zeros(len(forwards), dtype=np.int64)
+        shift_down = np.minimum.accumulate((natural_down - relative)[trunk-1::-1]) if trunk > 0 else np.empty(0, dtype=np.int64)
+        shift_up = np.maximum.accumulate((natural_up - relative)[trunk+1:])
+        mids[:trunk] = np.minimum(shift_down, 0)[::-1] + relative[:trunk]
+        mids[trunk+1:] = np.maximum(shift_up, 0) + relative[trunk+1:]
+        return mids
+
+    def _build_column(self, column : Column, dividend : tuple[float, float] = None) -> Column:
+        '''
+        Construit la colonne suivante et renseigne les transitions de la colonne courante (dividend = (facteur, montant) au détachement)
+        '''
+        is_div = dividend is not None
+        bottom, top, pruned_down, pruned_up = self._active_bounds(column)
+        if self.instrument:
+            self.report.pruned_nodes += pruned_down + pruned_up
+        trunk = column.trunk - bottom
+
+        #Forward des noeuds qui ont des fils et indice de leur noeud mid dans la colonne suivante
+        growth_factor = self.growth_factors[column.step]
+        forwards = self._dividend_forward(column.prices[bottom:top+1], column.step, dividend) if is_div else column.prices[bottom:top+1] * growth_factor
+        next_trunk_price = self._barrier_anchor(forwards[trunk]) if self.barrier_alignment else forwards[trunk]
+        if is_div:
+            mids = self._find_mids(forwards, next_trunk_price, trunk)
+        else:
+            mids = np.arange(len(forwards)) - trunk
+
+        #Bornes de la colonne suivante : un noeud supplémentaire de chaque côté si le noeud extrême n'est pas prunné
+        lowest = mids[0] if pruned_down else mids[0] - 1
+        highest = mids[-1] if pruned_up else mids[-1] + 1
+        next_prices = next_trunk_price * self.alpha ** np.arange(lowest, highest+1, dtype=float)
+        next_trunk = -int(lowest)
+        mids = mids + next_trunk
+
+        #Probabilités de transition : branchement trinomial à l'intérieur, monomial sur les noeuds prunnés
+        size = len(column.prices)
+        first, last = bottom + pruned_down, top - pruned_up
+        next_mid = np.zeros(size, dtype=np.int64)
+        next_mid[bottom:top+1] = mids
+        #Probabilités de transition en float64 quelle que soit la précision : elles fixent la géométrie (prunning) et s'accumulent sur tous les pas
+        p_up, p_mid, p_down = np.zeros(size), np.zeros(size), np.zeros(size)
+        #Probabilités propres à chaque noeud au dividende (variance interpolée sur la surface en volatilité locale)
+        is_local_vol = self.market.local_vol is not None
+        if is_div:
+            inner = slice(first - bottom, last - bottom + 1)
+            prices = column.prices[first:last+1]
+            factor = dividend[0]
+            if is_local_vol:
+                variance_factors = np.exp(self._local_volatility(prices, column.step) ** 2 * self.time_delta) - 1
+            else:
+                variance_factors = self.variance_factors[column.step]
+            variance = (prices * growth_factor * factor) ** 2 * variance_factors
+            forward, expectation = next_prices[mids[inner]], forwards[inner]
+            probas = transition_proba(self.alpha, forward, expectation, variance)
+            if is_local_vol:
+                probas = clamp_transition_proba(self.alpha, forward, expectation, probas[0], probas[1])
+            p_down[first:last+1], p_up[first:last+1], p_mid[first:last+1] = probas
+        elif is_local_vol:
+            p_down[first:last+1], p_up[first:last+1], p_mid[first:last+1] = self._local_vol_probas(column.prices[first:last+1], column.step)
+        else:
+            p_down[first:last+1], p_up[first:last+1], p_mid[first:last+1] = self.transition_probas[column.step]
+        if pruned_down:
+            p_mid[bottom] = 1.0
+        if pruned_up:
+            p_mid[top] = 1.0
+
+        #Probabilités d'existence des noeuds fils
+        next_size = len(next_prices)
+        weights = column.node_proba
+        next_proba = (np.bincount(np.minimum(next_mid + 1, next_size - 1), weights * p_up, next_size)
+                      + np.bincount(next_mid, weights * p_mid, next_size)
+                      + np.bincount(np.maximum(next_mid - 1, 0), weights * p_down, next_size))
+
+        if is_div or is_local_vol:
+            column.next_mid, column.p_up, column.p_mid, column.p_down = next_mid, p_up, p_mid, p_down
+        else:
+            column.bounds = (bottom, top, pruned_down, pruned_up, next_trunk - column.trunk)
+        return Column(prices = next_prices, node_proba = next_proba, trunk = next_trunk, step = column.step + 1)
+
+    ''' --------------------------------------------------------------------------------------------------------------------------------- '''
+    '''                                              Section pricing de l'option                                                          '''
+    ''' --------------------------------------------------------------------------------------------------------------------------------- '''
+
+    @instrumented("Price")
+    def price(self) -> float:
+        '''
+        Price l'option par rétropropagation vectorisée colonne par colonne et garde le payoff de chaque colonne
+        '''
+        for column, payoff in zip(self.columns, self.backward_induction()):
+            column.payoff = payoff
+        self.root_price = float(self.columns[0].payoff[0])
+        return self.root_price
+
+    def backward_induction(self) -> list[np.ndarray]:
+        '''
+        Valeurs de l'option sur chaque colonne, sans modifier les colonnes : la grille peut être partagée par plusieurs payoffs (voir Lattice).
+        Knock-in : les valeurs de la vanille sont reprises aux noeuds qui franchissent la barrière
+        '''
+        if self.knock == "in":
+            return self._backward_induction("in", self._backward_induction())
+        return self._backward_induction(self.knock)
+
+    def _backward_induction(self, knock : str = None, vanilla : list[np.ndarray] = None) -> list[np.ndarray]:
+        '''
+        Rétropropagation colonne par colonne, avec le masque de barrière (knock "out" ou "in") sur les colonnes observées.
+        La colonne courante est gardée en float64, seule la copie stockée de chaque colonne est dans la précision choisie
+        '''
+        #Pas d'exercice d'un knock-in avant son activation : la vanille porte l'exercice
+        exercise_mask = self.exercise_mask if knock != "in" else np.zeros(self.nb_steps + 1, dtype=bool)
+        barrier_mask = self.barrier_mask if knock is not None else np.zeros(self.nb_steps + 1, dtype=bool)
+        payoffs = [None] * (self.nb_steps + 1)
+        last_prices = self.columns[-1].prices.astype(float, copy=False)
+        values = self._final_payoffs(last_prices) if knock != "in" else np.zeros(len(last_prices))
+        if barrier_mask[-1]:
+            values = self._knock(values, self.columns[-1].prices, vanilla[-1] if knock == "in" else 0.0)
+        payoffs[-1] = values.astype(self.precision, copy=False)
+        last_step = self.nb_steps - 1
+        if self.smooth_last_step and last_step >= 0:
+            values = self._smoothed_last_step(self.columns[last_step].prices.astype(float, copy=False), last_step)
+            payoffs[last_step] = values.astype(self.precision, copy=False)
+            last_step -= 1
+
+        for step in range(last_step, -1, -1):
+            column = self.columns[step]
+            prices = column.prices.astype(float, copy=False)
+            values = self._continuation(column, values)
+            #Exercice anticipé sur toute la colonne
+            if exercise_mask[step]:
+                values = np.maximum(values, self.option.payoff_vector(prices))
+            #Masque de barrière sur toute la colonne
+            if barrier_mask[step]:
+                values = self._knock(values, column.prices, vanilla[step] if knock == "in" else 0.0)
+            payoffs[step] = values.astype(self.precision, copy=False)
+
+        return payoffs
+
+    def _continuation(self, column : Column, next_values : np.ndarray) -> np.ndarray:
+        '''
+        Valeur de continuation actualisée d'une colonne (vecteur de valeurs, ou matrice options x noeuds pour price_batch) :
+        transitions gardées noeud par noeud, sinon reconstruites depuis la géométrie de la colonne régulière
+        '''
+        if column.bounds is None:
+            up = np.minimum(column.next_mid + 1, next_values.shape[-1] - 1)
+            down = np.maximum(column.next_mid - 1, 0)
+            expectation = column.p_up * next_values[..., up] + column.p_mid * next_values[..., column.next_mid] + column.p_down * next_values[..., down]
+            return expectation * self.discount_factors[column.step]
+        current = np.empty(next_values.shape[:-1] + (len(column.prices),))
+        self._regular_roll_back(column.step, column.bounds, self.transition_probas[column.step], next_values, current)
+        return current
+
+    def _regular_roll_back(self, step : int, bounds : tuple[int, int, bool, bool, int], probas : tuple, next_values : np.ndarray, current : np.ndarray) -> None:
+        '''
+        Rétropropagation d'une colonne sans dividende : le mid du noeud i est le noeud i + shift de la colonne suivante,
+        branchement monomial sur les noeuds prunnés. Écrit dans current (vecteur ou matrice options x noeuds)
+        '''
+        bottom, top, pruned_down, pruned_up, shift = bounds
+        first, last = bottom + pruned_down, top - pruned_up
+        p_down, p_up, p_mid = probas
+        discount = self.discount_factors[step]
+        #Noeuds sans fils (au delà du premier noeud prunné) : valeur de continuation nulle
+        current[...] = 0
+        current[..., first:last+1] = (p_up * next_values[..., first+shift+1:last+shift+2] + p_mid * next_values[..., first+shift:last+shift+1]
+                                      + p_down * next_values[..., first+shift-1:last+shift]) * discount
+        if pruned_down:
+            current[..., bottom] = next_values[..., bottom+shift] * discount
+        if pruned_up:
+            current[..., top] = next_values[..., top+shift] * discount
+
+    def price_batch(self, options : list) -> np.ndarray:
+        '''
+        Price plusieurs options sur la grille déjà générée (même marché, maturité et dividende) :
+        la rétropropagation porte sur une matrice (options x noeuds), seul le payoff diffère (sans lissage du dernier pas ni barrière)
+        '''
+        if any(isinstance(option, BarrierOption) for option in options):
+            raise ValueError("Les options à barrière sont pricées une par une (price ou Lattice.price)")
+        #Matrice des dates d'exercice de chaque option, placées sur la grille de temps partagée
+        exercise = np.array([self._option_exercise_mask(option)[:self.nb_steps] for option in options])
+        #Une instance empilée par classe d'option pour évaluer les payoffs en une opération
+        payoff_groups = {}
+        for row, option in enumerate(options):
+            payoff_groups.setdefault(type(option), []).append(row)
+        payoff_groups = [(rows, stack_options([options[row] for row in rows])) for rows in payoff_groups.values()]
+
+        def payoff_matrix(prices : np.ndarray) -> np.ndarray:
+            payoffs = np.empty((len(options), len(prices)))
+            for rows, stacked_option in payoff_groups:
+                payoffs[rows] = stacked_option.payoff_vector(prices)
+            return payoffs
+
+        values = payoff_matrix(self.columns[-1].prices)
+        for step in range(self.nb_steps - 1, -1, -1):
+            column = self.columns[step]
+            values = self._continuation(column, values)
+            #Exercice anticipé uniquement pour les options exerçables à ce timeStep
+            rows = exercise[:, step]
+            if rows.any():
+                values[rows] = np.maximum(values[rows], payoff_matrix(column.prices)[rows])
+
+        return values[:, 0]
@@ -1,38 +1,81 @@
 from datetime import datetime
+import os
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
-from PythonFiles.options import Option, EuropeanCallOption, EuropeanPutOption, AmericanCallOption, AmericanPutOption, BermudeanCallOption, BermudeanPutOption, DigitalCallOption, DigitalPutOption
+from PythonFiles.options import Option, CallOption, EuropeanCallOption, EuropeanPutOption, AmericanCallOption, AmericanPutOption, BermudeanCallOption, BermudeanPutOption, DigitalCallOption, DigitalPutOption
 from PythonFiles.visualisation import visualize_tree
 from PythonFiles.market import Market
+from PythonFiles.blackScholes import black_scholes_price, digital_price
 from PythonFiles.tree import Tree
 from PythonFiles.treeMemoryAlloc import TreeMemoryAlloc
+from PythonFiles.treeVectorized import TreeVectorized
 from PythonFiles.greeks import Greeks
+from PythonFiles.scenarios import PricingJob, run_job
+from PythonFiles.priceCache import PriceCache, cache_key
 
-def generate_and_price(market, option, nb_steps : int, prunning : float, visualise : bool = False, greeks : bool = False):
+def generate_and_price(market, option, nb_steps : int, prunning : float, visualise : bool = False, greeks : bool = False, richardson : bool = False, smoothing : bool = False,
+                       cache : PriceCache = None, tree : Tree = None, instrument : bool = False, instrument_memory : bool = False, price_tolerance : float = None):
     '''
-    Fonction qui permet de générer le prix d'une option avec un arbre. Possibilité de plot l'arbre et de calculer les grecs
+    Fonction qui permet de générer le prix d'une option avec un arbre. Possibilité de plot l'arbre et de calculer les grecs.
+    Avec richardson, le prix est extrapolé à partir des arbres lissés à N/2, N et 2N pas (voir Tree.price_richardson) et le dictionnaire contient
+    l'estimation d'erreur et le temps de chaque grille.
+    Avec smoothing, le dernier pas est lissé (Black-Scholes pour les vanilles, payoff moyenné par noeud pour les digitales)
+    Avec un cache, un contrat déjà pricé avec les mêmes paramètres est renvoyé sans reconstruire l'arbre (sauf si l'arbre doit être affiché).
+    Un arbre déjà généré peut être passé (tree) : il n'est régénéré que si la grille a changé, sinon seule la rétropropagation est refaite.
+    Avec instrument, le dictionnaire contient le rapport de construction de l'arbre (TreeReport) sous la clé "Report", avec le pic mémoire si instrument_memory
+    Avec price_tolerance, le prunning est dérivé de la tolérance cible sur le prix au lieu du seuil de probabilité prunning.
+    Avec greeks, delta, gamma et theta sont lus sur l'arbre déjà pricé (from_lattice) : seuls vega et rho demandent de nouveaux arbres
     '''
-    tree = Tree(market=market, option=option, nb_steps=nb_steps, prunning_value=prunning)
-    start=time.time()
-    tree.generate_tree()
-    timer_generate = round(time.time()-start,5)
-    start=time.time()
-    tree.price()
-    timer_price = round(time.time()-start,5)
+    use_cache = cache is not None and not (visualise and nb_steps < 25)
+    if use_cache:
+        #Le moteur et ses réglages changent aussi le prix : ceux de l'arbre passé en paramètre, sinon les valeurs par défaut de Tree
+        engine = Tree if tree is None else type(tree)
+        reference = Tree if tree is None else tree
+        key = cache_key(market, option, nb_steps, prunning, greeks=greeks, richardson=richardson, smoothing=smoothing, instrument=instrument, instrument_memory=instrument_memory,
+                        price_tolerance=price_tolerance, engine=engine, barrier_alignment=reference.barrier_alignment, compact_nodes=reference.compact_nodes,
+                        precision=getattr(reference, "precision", None))
+        cached = cache.get(key)
+        if cached is not None:
+            return cached[0], cached[1], None
+
+    if tree is None:
+        tree = Tree(market=market, option=option, nb_steps=nb_steps, prunning_value=prunning, smoothing=smoothing, instrument=instrument, instrument_memory=instrument_memory,
+                    price_tolerance=price_tolerance)
+    else:
+        tree.market, tree.option, tree.nb_steps, tree.prunning_value, tree.smoothing = market, option, nb_steps, prunning, smoothing
+        tree.price_tolerance = price_tolerance
+        tree.instrument, tree.instrument_memory = instrument, instrument_memory
+    if richardson:
+        timer_dict = tree.price_richardson()
+        price = timer_dict.pop("Price")
+        for name in ("Time N/2", "Time N", "Time 2N"):
+            timer_dict[name] = round(timer_dict[name],5)
+    else:
+        start=time.time()
+        tree.refresh_tree()
+        timer_generate = round(time.time()-start,5)
+        start=time.time()
+        price = tree.price()
+        timer_price = round(time.time()-start,5)
+        timer_dict = {"Time Generate" : timer_generate, "Time Price" : timer_price}
 
-    price = tree.root_node.payoff
     close_formula_price = option.compute_price(market)
+    report = tree.report if instrument else None
     
     fig, greeks_dict = None, None
     if visualise and nb_steps < 25:
         fig = visualize_tree(tree,nb_steps)
     if greeks:
-        greeks_obj = Greeks(epsilon=0.01, tree=tree)
+        greeks_obj = Greeks(epsilon=0.01, tree=tree, from_lattice=True, cache=cache)
         greeks_obj.compute_greeks()
         greeks_dict = {"Delta" : greeks_obj.delta, "Gamma" : greeks_obj.gamma, "Vega" : greeks_obj.vega, "Theta" : greeks_obj.theta, "Rho" : greeks_obj.rho}
-    print("-----------------------------------------------")
 
-    info_dict = {"Price" : price, "Benchmark Price" : close_formula_price, "Time Generate" : timer_generate, "Time Price" : timer_price}
+    info_dict = {"Price" : price, "Benchmark Price" : close_formula_price, **timer_dict}
+    if report is not None:
+        info_dict["Report"] = report
+    if use_cache:
+        cache.put(key, (info_dict, greeks_dict))
     return info_dict, greeks_dict, fig
 
 def price_tree_memory(market, option, nb_steps : int, prunning : float):
@@ -46,25 +89,88 @@ def price_tree_memory(market, option, nb_steps : int, prunning : float):
     close_formula_price = option.compute_price(market)
     return price, timer_price
 
-def calculate_prices_range(steps : list, market : Market, option : Option):
+def price_tree_vectorized(market, option, nb_steps : int, prunning : float):
     '''
-    Fonction permettant de calculer le temps d'exécution et le prix pour un nombre de step donné
+    Fonction qui permet de générer le prix d'une option avec l'arbre vectorisé (colonnes stockées en tableaux numpy)
     '''
-    prices = []
-    execution_times = []
-    
-    for step in steps:
-        tree = Tree(market = market, option=option, nb_steps=int(step), prunning_value=1e-10)
-        start=time.time()
+    tree_vectorized = TreeVectorized(market=market, option=option, nb_steps=nb_steps, prunning_value=prunning)
+    start=time.time()
+    tree_vectorized.generate_tree()
+    price = tree_vectorized.price()
+    timer_price = round(time.time()-start,5)
+    return price, timer_price
+
+def price_portfolio(market : Market, options : list[Option], nb_steps : int, prunning : float) -> np.ndarray:
+    '''
+    Fonction qui price un portefeuille d'options sur un même sous-jacent : un seul arbre par couple (maturité, timeSteps des dividendes),
+    tous les payoffs qui partagent cet arbre sont rétropropagés ensemble
+    '''
+    trees = {}
+    for index, option in enumerate(options):
+        tree = TreeVectorized(market=market, option=option, nb_steps=nb_steps, prunning_value=prunning)
+        trees.setdefault((option.time_to_maturity, tuple(tree.dividend_steps)), (tree, []))[1].append(index)
+
+    prices = np.empty(len(options))
+    for tree, indices in trees.values():
         tree.generate_tree()
-        tree.price()
-        temps_exec = round(time.time()-start,5)
+        prices[indices] = tree.price_batch([options[index] for index in indices])
+    return prices
+
+def closed_form_prices(market : Market, options : list[Option]) -> np.ndarray:
+    '''
+    Prix en formule fermée de toutes les options (benchmark des prix de l'arbre) : européennes et digitales en un seul appel vectorisé.
+    Avec un calendrier de dividendes, et pour les barrières, chaque option est pricée par son compute_price.
+    Les options à exercice anticipé n'ont pas de formule fermée : ValueError
+    '''
+    if any(isinstance(option, (AmericanCallOption, AmericanPutOption, BermudeanCallOption, BermudeanPutOption)) for option in options):
+        raise ValueError("Pas de formule fermée pour les options à exercice anticipé (américaines, bermudéennes) : pricer avec l'arbre")
+    closed_form_types = (EuropeanCallOption, EuropeanPutOption, DigitalCallOption, DigitalPutOption)
+    vectorised = np.array([not market.dividends and isinstance(option, closed_form_types) for option in options], dtype=bool)
+    prices = np.empty(len(options))
+    rows = np.flatnonzero(vectorised)
+    if rows.size > 0:
+        group = [options[row] for row in rows]
+        strikes = np.array([option.strike for option in group], dtype=float)
+        maturities = np.array([option.time_to_maturity for option in group], dtype=float)
+        rates, volatilities = np.array([market.flat_parameters(maturity) for maturity in maturities]).T
+        is_call = np.array([isinstance(option, (CallOption, DigitalCallOption)) for option in group])
+        is_digital = np.array([isinstance(option, (DigitalCallOption, DigitalPutOption)) for option in group])
+        coupons = np.array([getattr(option, "coupon", 1) for option in group], dtype=float)
+        prices[rows] = np.where(is_digital, digital_price(market.spot, strikes, maturities, volatilities, rates, market.dividende, is_call, coupons),
+                                black_scholes_price(market.spot, strikes, maturities, volatilities, rates, market.dividende, is_call))
+    for row in np.flatnonzero(~vectorised):
+        prices[row] = options[row].compute_price(market)
+    return prices
 
-        prices.append(tree.root_node.payoff)         
-        execution_times.append(temps_exec)  
+def iter_prices_range(steps : list, market : Market, option : Option, prunning : float = 1e-10, engine : type[Tree] = Tree, max_workers : int = None,
+                      price_tolerance : float = None):
+    '''
+    Générateur qui renvoie (nombre de pas, prix, temps d'exécution) dès qu'un arbre est pricé.
+    Les plus grands nombres de pas, qui dominent le temps total, sont lancés en premier sur les process du pool
+    '''
+    jobs = [PricingJob(market=market, option=option, nb_steps=int(step), prunning_value=prunning, price_tolerance=price_tolerance, engine=engine)
+            for step in sorted(steps, reverse=True)]
+    max_workers = max_workers or os.cpu_count()
+    if max_workers == 1:
+        for job in jobs:
+            result = run_job(job)
+            yield job.nb_steps, result["Price"], round(result["Time"],5)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_job, job) : job.nb_steps for job in jobs}
+        for future in as_completed(futures):
+            result = future.result()
+            yield futures[future], result["Price"], round(result["Time"],5)
+
+def calculate_prices_range(steps : list, market : Market, option : Option, prunning : float = 1e-10, engine : type[Tree] = Tree, max_workers : int = None,
+                           price_tolerance : float = None):
+    '''
+    Fonction permettant de calculer le temps d'exécution et le prix pour un nombre de step donné
+    '''
+    results = {step : (price, temps_exec) for step, price, temps_exec in iter_prices_range(steps, market, option, prunning, engine, max_workers, price_tolerance)}
 
-    prices_array = np.array(prices)
-    execution_times_array = np.array(execution_times)
+    prices_array = np.array([results[int(step)][0] for step in steps])
+    execution_times_array = np.array([results[int(step)][1] for step in steps])
     return (prices_array, execution_times_array)
 
 ############# Fonctions qui permettent de créer les instances de classe depuis le fichier excel
@@ -3,8 +3,15 @@ import pandas as pd
 from PythonFiles.market import Market
 from PythonFiles.options import EuropeanCallOption, EuropeanPutOption, AmericanCallOption, AmericanPutOption, BermudeanCallOption, BermudeanPutOption, DigitalCallOption, DigitalPutOption
 from PythonFiles.utils import generate_and_price
+from PythonFiles.priceCache import PriceCache
+from PythonFiles.tree import Tree
 from datetime import datetime, timedelta
 
+@st.cache_resource
+def get_price_cache() -> PriceCache:
+    # Cache partagé entre les reruns : un contrat déjà pricé n'est pas recalculé à chaque clic
+    return PriceCache()
+
 st.title("Trinomial Tree Pricer")
 st.header("Price your option :")
 
@@ -58,10 +65,17 @@ col1, col2 = st.columns(2)
 with col1:
     nb_steps = st.number_input("Number of steps", value=1000)
     is_greeks = st.checkbox("Calculate Greeks ?", value=False)
+    is_richardson = st.checkbox("Richardson extrapolation (N/2, N and 2N steps) ?", value=False)
+    #Richardson n'est fiable que sur des arbres lissés : le lissage est alors imposé
+    is_smoothing = st.checkbox("Smooth the last step (Black-Scholes / averaged digital payoff) ?", value=is_richardson, disabled=is_richardson)
 with col2:
     prunning_value = st.number_input("Prunning treshold (number of decimals)", value=8)
     prunning_value = 10 ** (-prunning_value)
+    is_tolerance = st.checkbox("Prune from a target price tolerance instead ?", value=False)
+    price_tolerance = st.number_input("Price tolerance", value=1e-4, format="%.1e") if is_tolerance else None
     is_visu = st.checkbox("Visualise ?", value=False)
+    is_instrument = st.checkbox("Build report (timings, nodes, prunning) ?", value=False)
+    is_instrument_memory = st.checkbox("Include peak memory in the report (slower) ?", value=False)
 
 price_button = st.button("Compute option price")
 if price_button:
@@ -96,7 +110,10 @@ if price_button:
                         option = DigitalPutOption(time_to_maturity=maturity, strike=strike, start_date=start_date, coupon=coupon)
 
             market = Market(spot=spot, rate=rate, volatility=vol,div_date=div_date, dividende=div)
-            info_dict, greeks_dict, fig = generate_and_price(market=market, option=option, nb_steps=nb_steps, prunning=prunning_value, visualise=is_visu, greeks=is_greeks)
+            # Arbre gardé entre les reruns : si seuls le payoff ou les dates d'exercice changent, seule la rétropropagation est refaite
+            if 'tree' not in st.session_state:
+                st.session_state.tree = Tree(market=market, option=option, nb_steps=nb_steps, prunning_value=prunning_value)
+            info_dict, greeks_dict, fig = generate_and_price(market=market, option=option, nb_steps=nb_steps, prunning=prunning_value, visualise=is_visu, greeks=is_greeks, richardson=is_richardson, smoothing=is_smoothing, cache=get_price_cache(), tree=st.session_state.tree, instrument=is_instrument, instrument_memory=is_instrument_memory, price_tolerance=price_tolerance)
             st.write("---")
 
             option_price = round(info_dict["Price"],5)
@@ -104,9 +121,18 @@ if price_button:
                     close_formula_price = round(info_dict["Benchmark Price"],5)
             else:
                 close_formula_price = 'N/A'
-            tree_time = round(info_dict["Time Generate"],3)
-            pricing_time = round(info_dict["Time Price"],3)
+            if is_richardson:
+                error_html = f'<p> <b>Error estimate (|P(2N) - P(N)|) :</b> {round(info_dict["Error Estimate"],5)}</p>'
+                if not info_dict["Extrapolated"]:
+                    error_html += '<p> Non-monotone convergence : price of the 2N grid, without extrapolation</p>'
+                time_labels = ("Trees with N/2 and N steps priced in", "Tree with 2N steps priced in")
+                tree_time, pricing_time = round(info_dict["Time N/2"] + info_dict["Time N"],3), round(info_dict["Time 2N"],3)
+            else:
+                error_html = ""
+                time_labels = ("Tree generated in", "Option priced in")
+                tree_time, pricing_time = round(info_dict["Time Generate"],3), round(info_dict["Time Price"],3)
             total_time = round(tree_time + pricing_time,3)
+            cache_stats = get_price_cache().stats()
 
             html_code = f'''
             <div class="results-container">
@@ -115,12 +141,14 @@ if price_button:
                     <h3>Pricing :</h3>
                     <p> <b>Option price :</b> {option_price}</p>
                     <p> <b>VS Close formula price </b>: {close_formula_price}</p>
+                    {error_html}
                 </div>
                 <div class="performance">
                     <h3><b>Performance :<b></h3>
-                    <p> <b>Tree generated in :</b> {tree_time} sec</p>
-                    <p> <b>Option priced in :</b> {pricing_time} sec</p>
+                    <p> <b>{time_labels[0]} :</b> {tree_time} sec</p>
+                    <p> <b>{time_labels[1]} :</b> {pricing_time} sec</p>
                     <p> <b>Total time :</b> {total_time} sec</p>
+                    <p> <b>Cache hits / misses :</b> {cache_stats["Memory Hits"] + cache_stats["Disk Hits"]} / {cache_stats["Misses"]}</p>
                 </div>
             </div>
 
@@ -156,6 +184,12 @@ if price_button:
                 df.style.hide(axis='index')
                 st.table(df)
 
+            if "Report" in info_dict:
+                st.subheader("Build report :")
+                report = info_dict["Report"]
+                st.table(pd.DataFrame(list(report.summary().items()), columns=["Statistic", "Value"]).astype(str))
+                st.line_chart(report.columns_frame(), x="Step", y="Nodes")
+
             if nb_steps >= 25 and is_visu:
                 st.warning("Cannot visualize more than 25 steps")
             else :
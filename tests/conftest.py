@@ -0,0 +1,17 @@
+import sys
+from pathlib import Path
+from datetime import datetime
+import pytest
+
+#Les modules sont importés depuis la racine du dépôt (from PythonFiles.x import Y), comme dans app.py
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from PythonFiles.market import Market
+
+@pytest.fixture
+def start_date() -> datetime:
+    return datetime(2024, 1, 1)
+
+@pytest.fixture
+def market() -> Market:
+    return Market(spot=100, volatility=0.2, rate=0.05)
@@ -0,0 +1,68 @@
+from datetime import timedelta
+import numpy as np
+import pytest
+from PythonFiles.options import EuropeanCallOption, BarrierCallOption, BarrierPutOption
+from PythonFiles.tree import Tree
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.treeMemoryAlloc import TreeMemoryAlloc
+
+ENGINES = (Tree, TreeVectorized, TreeMemoryAlloc)
+NB_STEPS = 400
+
+def barrier_price(engine, market, option, barrier_alignment : bool) -> float:
+    tree = engine(market=market, option=option, nb_steps=NB_STEPS, prunning_value=1e-9, barrier_alignment=barrier_alignment)
+    tree.generate_tree()
+    return tree.price()
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_up_and_out_call_closed_form(market, start_date, engine):
+    #Formule fermée 1.17607 : la grille ancrée sur la barrière donne 1.17146, la grille naïve 1.30617 (barrière entre deux couches de noeuds)
+    option = BarrierCallOption(strike=100, time_to_maturity=1, start_date=start_date, barrier=120)
+    closed_form = option.compute_price(market)
+    assert closed_form == pytest.approx(1.17607, abs=1e-5)
+    aligned = barrier_price(engine, market, option, barrier_alignment=True)
+    naive = barrier_price(engine, market, option, barrier_alignment=False)
+    assert aligned == pytest.approx(1.17146, abs=1e-5)
+    assert naive == pytest.approx(1.30617, abs=1e-5)
+    assert abs(aligned - closed_form) < 0.01
+
+@pytest.mark.parametrize("option_class, barrier, direction", [(BarrierCallOption, 120, "up"), (BarrierCallOption, 90, "down"),
+                                                              (BarrierPutOption, 120, "up"), (BarrierPutOption, 90, "down")])
+@pytest.mark.parametrize("knock", ["out", "in"])
+def test_aligned_lattice_matches_closed_form(market, start_date, option_class, barrier, direction, knock):
+    option = option_class(strike=100, time_to_maturity=1, start_date=start_date, barrier=barrier, direction=direction, knock=knock)
+    prices = [barrier_price(engine, market, option, barrier_alignment=True) for engine in ENGINES]
+    assert max(prices) - min(prices) < 1e-10
+    assert prices[0] == pytest.approx(option.compute_price(market), abs=0.02)
+
+def test_in_out_parity(market, start_date):
+    vanilla = EuropeanCallOption(strike=100, time_to_maturity=1, start_date=start_date)
+    tree = TreeVectorized(market=market, option=vanilla, nb_steps=NB_STEPS, prunning_value=1e-9)
+    tree.generate_tree()
+    knocked = [barrier_price(TreeVectorized, market, BarrierCallOption(strike=100, time_to_maturity=1, start_date=start_date, barrier=120, knock=knock), True)
+               for knock in ("out", "in")]
+    #La vanille n'est pas sur la grille ancrée : l'écart reste de l'ordre de l'erreur de discrétisation
+    assert sum(knocked) == pytest.approx(tree.price(), abs=5e-3)
+
+def test_discrete_monitoring(market, start_date):
+    #Référence Monte Carlo aux dates d'observation : la correction de Broadie-Glasserman-Kou de compute_price (1.971) surestime ici le prix d'environ 0.12
+    dates = [start_date + timedelta(days=int(365 * month / 12)) for month in range(1, 13)]
+    option = BarrierCallOption(strike=100, time_to_maturity=1, start_date=start_date, barrier=120, monitoring_dates=dates)
+    tree = TreeVectorized(market=market, option=option, nb_steps=730, prunning_value=1e-9)
+    tree.generate_tree()
+    assert tree.barrier_mask.sum() == len(dates)
+
+    rng = np.random.default_rng(0)
+    periods = np.diff([0] + [(date - start_date).days / 365 for date in dates])
+    prices, alive = np.full(400000, float(market.spot)), np.ones(400000, dtype=bool)
+    for period in periods:
+        prices = prices * np.exp((market.rate - 0.5 * market.volatility ** 2) * period + market.volatility * np.sqrt(period) * rng.standard_normal(len(prices)))
+        alive &= prices < option.barrier
+    monte_carlo = np.exp(-market.rate) * np.mean(np.maximum(prices - option.strike, 0) * alive)
+    assert tree.price() == pytest.approx(monte_carlo, abs=0.03)
+
+def test_alignment_requires_a_barrier(market, start_date):
+    tree = Tree(market=market, option=EuropeanCallOption(strike=100, time_to_maturity=1, start_date=start_date), nb_steps=10, prunning_value=1e-9,
+                barrier_alignment=True)
+    with pytest.raises(ValueError):
+        tree.generate_tree()
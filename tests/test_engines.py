@@ -0,0 +1,91 @@
+from datetime import datetime
+from math import sqrt
+import pytest
+from PythonFiles.market import Market, Dividend, TermStructure, VolSurface
+from PythonFiles.blackScholes import black_scholes_price
+from PythonFiles.options import EuropeanCallOption, EuropeanPutOption, AmericanPutOption, BermudeanCallOption, DigitalCallOption
+from PythonFiles.tree import Tree
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.treeMemoryAlloc import TreeMemoryAlloc
+
+ENGINES = (Tree, TreeVectorized, TreeMemoryAlloc)
+NB_STEPS = 200
+
+def engine_prices(market, option, **settings) -> list[float]:
+    prices = []
+    for engine in ENGINES:
+        tree = engine(market=market, option=option, nb_steps=NB_STEPS, prunning_value=1e-10, **settings)
+        tree.generate_tree()
+        prices.append(tree.price())
+    return prices
+
+def make_options(start_date) -> list:
+    return [EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date),
+            EuropeanPutOption(time_to_maturity=1, strike=95, start_date=start_date),
+            AmericanPutOption(time_to_maturity=1, strike=105, start_date=start_date),
+            BermudeanCallOption(time_to_maturity=1, strike=100, start_date=start_date, exercise_dates=[datetime(2024, 4, 1), datetime(2024, 9, 1)]),
+            DigitalCallOption(time_to_maturity=1, strike=100, start_date=start_date, coupon=1)]
+
+@pytest.mark.parametrize("index", range(5))
+def test_engines_agree(market, start_date, index):
+    option = make_options(start_date)[index]
+    prices = engine_prices(market, option)
+    assert max(prices) - min(prices) < 1e-10
+
+def test_engines_agree_with_single_dividend(start_date):
+    market = Market(spot=100, volatility=0.2, rate=0.05, dividende=3, div_date=datetime(2024, 6, 1))
+    for option in make_options(start_date):
+        prices = engine_prices(market, option)
+        assert max(prices) - min(prices) < 1e-10, type(option).__name__
+
+def test_engines_agree_with_dividend_schedule(start_date):
+    #Calendrier mêlant un dividende cash et un dividende proportionnel
+    market = Market(spot=100, volatility=0.2, rate=0.05, dividends=[Dividend(date=datetime(2024, 6, 1), amount=2), Dividend(date=datetime(2024, 9, 1), proportional=0.01)])
+    for option in make_options(start_date):
+        prices = engine_prices(market, option)
+        assert max(prices) - min(prices) < 1e-10, type(option).__name__
+
+def test_european_converges_to_black_scholes(market, start_date):
+    option = EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date)
+    assert engine_prices(market, option)[1] == pytest.approx(option.compute_price(market), abs=1e-2)
+
+@pytest.mark.parametrize("index", [0, 1, 4])
+def test_smoothing_agrees_and_reduces_error(market, start_date, index):
+    option = make_options(start_date)[index]
+    smoothed = engine_prices(market, option, smoothing=True)
+    assert max(smoothed) - min(smoothed) < 1e-10
+    raw_error = abs(engine_prices(market, option)[1] - option.compute_price(market))
+    assert abs(smoothed[1] - option.compute_price(market)) < raw_error
+
+@pytest.mark.parametrize("option_class, is_call", [(EuropeanCallOption, True), (EuropeanPutOption, False)])
+def test_term_structures_match_averaged_black_scholes(start_date, option_class, is_call):
+    market = Market(spot=100, volatility=0.2, rate=0.05, rate_curve=TermStructure([0.5, 1], [0.03, 0.06]), vol_curve=TermStructure([0.5, 1], [0.15, 0.25]))
+    option = option_class(time_to_maturity=1, strike=100, start_date=start_date)
+    #Taux moyen et variance moyenne sur les deux semestres
+    expected = float(black_scholes_price(100, 100, 1, sqrt((0.15 ** 2 + 0.25 ** 2) / 2), (0.03 + 0.06) / 2, 0, is_call))
+    assert option.compute_price(market) == pytest.approx(expected, abs=1e-12)
+    prices = engine_prices(market, option, smoothing=True)
+    assert max(prices) - min(prices) < 1e-10
+    assert prices[0] == pytest.approx(expected, abs=5e-3)
+
+def test_engines_agree_in_local_vol(start_date):
+    surface = VolSurface(times=[0, 0.5, 1], spots=[50, 80, 100, 120, 150],
+                         vols=[[0.35, 0.28, 0.22, 0.19, 0.18], [0.3, 0.25, 0.2, 0.18, 0.17], [0.28, 0.24, 0.2, 0.18, 0.17]])
+    market = Market(spot=100, volatility=0.2, rate=0.05, local_vol=surface, dividends=[Dividend(date=datetime(2024, 6, 1), amount=1.5)])
+    prices = engine_prices(market, AmericanPutOption(time_to_maturity=1, strike=100, start_date=start_date))
+    assert max(prices) - min(prices) < 1e-10
+
+def test_flat_local_vol_matches_constant_volatility(market, start_date):
+    surface = VolSurface(times=[0, 1], spots=[80, 120], vols=[[0.2, 0.2], [0.2, 0.2]])
+    option = AmericanPutOption(time_to_maturity=1, strike=100, start_date=start_date)
+    local = engine_prices(Market(spot=100, volatility=0.3, rate=0.05, local_vol=surface), option)
+    assert local == pytest.approx(engine_prices(market, option), abs=1e-8)
+
+def test_local_vol_keeps_only_dividend_transitions(start_date):
+    #Les probabilités des colonnes régulières sont recalculées à la rétropropagation : rien n'est stocké hors dividende
+    surface = VolSurface(times=[0, 1], spots=[80, 120], vols=[[0.25, 0.18], [0.25, 0.18]])
+    market = Market(spot=100, volatility=0.2, rate=0.05, local_vol=surface)
+    tree = TreeMemoryAlloc(market=market, option=AmericanPutOption(time_to_maturity=1, strike=100, start_date=start_date), nb_steps=NB_STEPS, prunning_value=1e-10)
+    tree.generate_tree()
+    tree.price()
+    assert tree.div_transitions == {}
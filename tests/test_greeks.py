@@ -0,0 +1,30 @@
+import pytest
+from PythonFiles.options import EuropeanCallOption, EuropeanPutOption
+from PythonFiles.tree import Tree
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.greeks import Greeks
+from PythonFiles.blackScholes import black_scholes_greeks
+
+#Écarts admis : discrétisation de l'arbre, et chocs à droite de 1% sur la volatilité et le taux (vega, rho)
+TOLERANCES = {"delta" : 1e-3, "gamma" : 1e-4, "theta" : 1e-2, "vega" : 0.1, "rho" : 1.5}
+
+@pytest.mark.parametrize("engine", [Tree, TreeVectorized])
+@pytest.mark.parametrize("option_class", [EuropeanCallOption, EuropeanPutOption])
+def test_lattice_greeks_match_black_scholes(market, start_date, engine, option_class):
+    option = option_class(strike=100, time_to_maturity=1, start_date=start_date)
+    greeks = Greeks(tree=engine(market=market, option=option, nb_steps=500, prunning_value=1e-10, smoothing=True), from_lattice=True)
+    greeks.compute_greeks()
+    closed_form = black_scholes_greeks(market.spot, option.strike, option.time_to_maturity, market.volatility, market.rate, 0, option_class is EuropeanCallOption)
+    for name, tolerance in TOLERANCES.items():
+        assert getattr(greeks, name) == pytest.approx(float(closed_form[name.capitalize()]), abs=tolerance), name
+
+def test_lattice_greeks_agree_with_bumped_greeks(market, start_date):
+    option = EuropeanCallOption(strike=100, time_to_maturity=1, start_date=start_date)
+    results = []
+    for from_lattice in (True, False):
+        greeks = Greeks(tree=TreeVectorized(market=market, option=option, nb_steps=500, prunning_value=1e-10, smoothing=True), from_lattice=from_lattice)
+        greeks.compute_greeks()
+        results.append(greeks)
+    lattice, bumped = results
+    assert lattice.delta == pytest.approx(bumped.delta, abs=1e-2)
+    assert (lattice.vega, lattice.rho) == (bumped.vega, bumped.rho)
@@ -0,0 +1,21 @@
+from datetime import datetime
+import pytest
+from PythonFiles.market import Market, VolSurface
+from PythonFiles.options import EuropeanCallOption, AmericanPutOption
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.treeMemoryAlloc import TreeMemoryAlloc
+from PythonFiles.impliedVolatility import implied_volatility, tree_price
+
+@pytest.mark.parametrize("engine", [TreeVectorized, TreeMemoryAlloc])
+def test_round_trip(start_date, engine):
+    market = Market(spot=100, volatility=0.2, rate=0.05, dividende=2, div_date=datetime(2024, 6, 1))
+    option = AmericanPutOption(time_to_maturity=1, strike=105, start_date=start_date)
+    price = tree_price(market, option, 0.27, 200, 1e-10, engine)
+    assert implied_volatility(price, market, option, 200, 1e-10, engine) == pytest.approx(0.27, abs=1e-5)
+
+def test_local_vol_market_is_rejected(start_date):
+    surface = VolSurface(times=[0, 1], spots=[80, 120], vols=[[0.25, 0.18], [0.25, 0.18]])
+    market = Market(spot=100, volatility=0.2, rate=0.05, local_vol=surface)
+    option = EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date)
+    with pytest.raises(ValueError):
+        implied_volatility(10, market, option, 100, 1e-10)
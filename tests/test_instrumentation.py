@@ -0,0 +1,39 @@
+from datetime import datetime
+import pytest
+from PythonFiles.market import Market
+from PythonFiles.options import AmericanPutOption
+from PythonFiles.tree import Tree
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.treeMemoryAlloc import TreeMemoryAlloc
+
+ENGINES = (Tree, TreeVectorized, TreeMemoryAlloc)
+
+def instrumented_tree(engine, market, option, **settings):
+    tree = engine(market=market, option=option, nb_steps=200, prunning_value=1e-7, instrument=True, **settings)
+    tree.generate_tree()
+    tree.price()
+    return tree
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_report_counts_match_the_tree(market, start_date, engine):
+    tree = instrumented_tree(engine, market, AmericanPutOption(time_to_maturity=1, strike=100, start_date=start_date))
+    report = tree.report
+    assert report.engine == engine.__name__
+    assert report.nodes_per_column == tree.column_sizes()
+    assert report.pruned_nodes > 0
+    assert set(report.timings) == {"Generate", "Price"}
+    assert report.summary()["Nodes"] == sum(tree.column_sizes())
+
+def test_report_counts_agree_across_engines(start_date):
+    market = Market(spot=100, volatility=0.2, rate=0.05, dividende=3, div_date=datetime(2024, 6, 1))
+    option = AmericanPutOption(time_to_maturity=1, strike=100, start_date=start_date)
+    reports = [instrumented_tree(engine, market, option).report for engine in ENGINES]
+    for report in reports[1:]:
+        assert report.nodes_per_column == reports[0].nodes_per_column
+        assert report.pruned_nodes == reports[0].pruned_nodes
+
+def test_memory_is_tracked_on_demand(market, start_date):
+    option = AmericanPutOption(time_to_maturity=1, strike=100, start_date=start_date)
+    assert instrumented_tree(TreeVectorized, market, option).report.peak_memory == {}
+    report = instrumented_tree(TreeVectorized, market, option, instrument_memory=True).report
+    assert report.peak_memory["Generate"] > 0
@@ -0,0 +1,41 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from PythonFiles.options import EuropeanCallOption, EuropeanPutOption, AmericanPutOption, BermudeanPutOption, DigitalCallOption
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.lattice import Lattice
+
+NB_STEPS = 200
+
+def make_options(start_date) -> list:
+    return [EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date), EuropeanPutOption(time_to_maturity=1, strike=90, start_date=start_date),
+            AmericanPutOption(time_to_maturity=1, strike=110, start_date=start_date),
+            BermudeanPutOption(time_to_maturity=1, strike=100, start_date=start_date, exercise_dates=[datetime(2024, 6, 1)]),
+            DigitalCallOption(time_to_maturity=1, strike=105, start_date=start_date, coupon=2)]
+
+def standalone_price(market, option, smoothing : bool = False) -> float:
+    tree = TreeVectorized(market=market, option=option, nb_steps=NB_STEPS, prunning_value=1e-10, smoothing=smoothing)
+    tree.generate_tree()
+    return tree.price()
+
+@pytest.mark.parametrize("smoothing", [False, True])
+def test_price_matches_standalone_trees(market, start_date, smoothing):
+    options = make_options(start_date)
+    lattice = Lattice.from_option(market, options[0], NB_STEPS)
+    for option in options:
+        assert lattice.price(option, smoothing) == pytest.approx(standalone_price(market, option, smoothing), abs=1e-10)
+    #Les options pricées ne modifient pas la grille partagée
+    assert lattice.price(options[0], smoothing) == pytest.approx(standalone_price(market, options[0], smoothing), abs=1e-10)
+
+def test_price_batch_matches_standalone_trees(market, start_date):
+    options = make_options(start_date)
+    prices = Lattice.from_option(market, options[0], NB_STEPS).price_batch(options)
+    np.testing.assert_allclose(prices, [standalone_price(market, option) for option in options], rtol=0, atol=1e-10)
+
+def test_maturity_mismatch_is_rejected(market, start_date):
+    lattice = Lattice(market=market, time_to_maturity=1, start_date=start_date, nb_steps=NB_STEPS)
+    with pytest.raises(ValueError):
+        lattice.price(EuropeanCallOption(time_to_maturity=0.5, strike=100, start_date=start_date))
+    with pytest.raises(ValueError):
+        lattice.price_batch([EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date),
+                             EuropeanCallOption(time_to_maturity=1, strike=100, start_date=datetime(2024, 2, 1))])
@@ -0,0 +1,36 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from PythonFiles.market import Market
+from PythonFiles.options import EuropeanCallOption, EuropeanPutOption, DigitalCallOption, DigitalPutOption
+from PythonFiles.treeVectorized import TreeVectorized
+
+@pytest.mark.parametrize("option_class", [EuropeanCallOption, EuropeanPutOption])
+def test_monte_carlo_matches_black_scholes(market, start_date, option_class):
+    option = option_class(time_to_maturity=1, strike=105, start_date=start_date)
+    price, standard_error = option.monte_carlo(market, n_sim=200000, rng=np.random.default_rng(0))
+    assert abs(price - option.compute_price(market)) < 4 * standard_error + 1e-3
+
+def test_monte_carlo_detaches_market_dividend(start_date):
+    market = Market(spot=100, volatility=0.2, rate=0.05, dividende=3, div_date=datetime(2024, 6, 1))
+    option = EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date)
+    price, standard_error = option.monte_carlo(market, n_sim=200000, rng=np.random.default_rng(0))
+    tree = TreeVectorized(market=market, option=option, nb_steps=500, prunning_value=1e-10)
+    tree.generate_tree()
+    assert abs(price - tree.price()) < 4 * standard_error + 1e-2
+
+def test_monte_carlo_requires_start_date_with_dividends():
+    market = Market(spot=100, volatility=0.2, rate=0.05, dividende=3, div_date=datetime(2024, 6, 1))
+    with pytest.raises(ValueError):
+        EuropeanCallOption(time_to_maturity=1, strike=100).monte_carlo(market, n_sim=1000)
+    #Sans dividende, la date de début reste facultative
+    EuropeanCallOption(time_to_maturity=1, strike=100).monte_carlo(Market(spot=100, volatility=0.2, rate=0.05), n_sim=1000)
+
+def test_digital_closed_form(market, start_date):
+    call = DigitalCallOption(time_to_maturity=1, strike=100, start_date=start_date, coupon=2)
+    put = DigitalPutOption(time_to_maturity=1, strike=100, start_date=start_date, coupon=2)
+    #Parité : une des deux digitales paie toujours le coupon
+    assert call.compute_price(market) + put.compute_price(market) == pytest.approx(2 * np.exp(-market.rate), abs=1e-12)
+    tree = TreeVectorized(market=market, option=call, nb_steps=500, prunning_value=1e-10, smoothing=True)
+    tree.generate_tree()
+    assert tree.price() == pytest.approx(call.compute_price(market), abs=1e-3)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from PythonFiles.market import Market, VolSurface
+from PythonFiles.options import EuropeanCallOption
+from PythonFiles.tree import Tree
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.priceCache import PriceCache, cache_key
+
+def test_memory_hits_and_misses(market, start_date):
+    cache = PriceCache()
+    option = EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date)
+    first = cache.price(market, option, 50, 1e-10, engine=TreeVectorized)
+    assert cache.price(market, option, 50, 1e-10, engine=TreeVectorized) == first
+    assert cache.price(market, option, 50, 1e-10, engine=Tree) == pytest.approx(first, abs=1e-10)
+    stats = cache.stats()
+    assert (stats["Memory Hits"], stats["Misses"], stats["Entries"]) == (1, 2, 2)
+
+def test_eviction_keeps_most_recent():
+    cache = PriceCache(max_bytes=150)
+    for key in ("a", "b", "c"):
+        cache.put(key, [0.0] * 5)
+    cache.get("b")
+    cache.put("d", [0.0] * 5)
+    assert cache.nb_bytes <= 150
+    assert list(cache.entries) == ["b", "d"]
+
+def test_sqlite_tier(tmp_path):
+    db_path = str(tmp_path / "prices.db")
+    PriceCache(db_path=db_path).put("key", {"Price" : 10.45})
+    cache = PriceCache(db_path=db_path)
+    assert cache.get("key") == {"Price" : 10.45}
+    assert cache.get("key") == {"Price" : 10.45}
+    assert (cache.disk_hits, cache.memory_hits, cache.misses) == (1, 1, 0)
+
+def test_returned_values_are_copies():
+    cache = PriceCache()
+    value = {"Price" : 10.0}
+    cache.put("key", value)
+    value["Price"] = 0.0
+    cache.get("key")["Price"] = -1.0
+    assert cache.get("key") == {"Price" : 10.0}
+
+def test_numpy_values_are_canonical(market, start_date):
+    option = EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date)
+    assert cache_key(Market(spot=np.int64(100), volatility=0.2, rate=0.05), option, 50, 1e-10) == \
+           cache_key(Market(spot=np.float64(100), volatility=0.2, rate=0.05), option, 50, 1e-10)
+    #Le repr numpy d'un tableau 40x40 est tronqué : une seule cellule différente doit changer la clé
+    vols = np.full((40, 40), 0.2)
+    spots = np.linspace(50, 150, 40)
+    other = vols.copy()
+    other[20, 20] = 0.3
+    keys = [cache_key(Market(spot=100, volatility=0.2, rate=0.05, local_vol=VolSurface(times=np.linspace(0, 1, 40), spots=spots, vols=surface)), option, 50, 1e-10)
+            for surface in (vols, other)]
+    assert keys[0] != keys[1]
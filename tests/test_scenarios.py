@@ -0,0 +1,20 @@
+import pandas as pd
+from PythonFiles.options import AmericanPutOption
+from PythonFiles.scenarios import PricingJob, run_scenarios, spot_ladder
+
+def test_run_scenarios_keeps_submission_order(market, start_date):
+    #Les plus gros arbres en premier : un pool qui rendrait les résultats dans l'ordre de fin les inverserait
+    jobs = [PricingJob(market=market, option=AmericanPutOption(strike=strike, time_to_maturity=1, start_date=start_date), nb_steps=nb_steps)
+            for strike, nb_steps in ((90, 400), (100, 200), (110, 50))]
+    sequential = run_scenarios(jobs, max_workers=1)
+    parallel = run_scenarios(jobs, max_workers=2, chunksize=1)
+    pd.testing.assert_frame_equal(parallel.drop(columns="Time"), sequential.drop(columns="Time"))
+    assert sequential["Price"].is_monotonic_increasing
+
+def test_spot_ladder_rows_follow_spots(market, start_date):
+    option = AmericanPutOption(strike=100, time_to_maturity=1, start_date=start_date)
+    spots = [120, 80, 100]
+    ladder = spot_ladder(market, option, spots, nb_steps=100, prunning=1e-10, max_workers=2)
+    assert ladder["Spot"].tolist() == spots
+    assert ladder.set_index("Spot")["Price"].sort_index().is_monotonic_decreasing
+    assert (ladder["Delta"] < 0).all() and (ladder["Gamma"] > 0).all()
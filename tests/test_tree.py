@@ -0,0 +1,67 @@
+from datetime import datetime
+import pytest
+from PythonFiles.market import Market, Dividend
+from PythonFiles.options import EuropeanCallOption, AmericanPutOption
+from PythonFiles.tree import Tree
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.treeMemoryAlloc import TreeMemoryAlloc
+
+def fresh_price(market, option, **settings) -> float:
+    tree = Tree(market=market, option=option, nb_steps=200, prunning_value=1e-10, **settings)
+    tree.generate_tree()
+    return tree.price()
+
+@pytest.mark.parametrize("strike", [90, 100, 110])
+def test_richardson_does_not_degrade_vanilla(market, start_date, strike):
+    option = EuropeanCallOption(time_to_maturity=1, strike=strike, start_date=start_date)
+    closed_form = option.compute_price(market)
+    tree = TreeVectorized(market=market, option=option, nb_steps=200, prunning_value=1e-10)
+    tree.generate_tree()
+    raw_error = abs(tree.price() - closed_form)
+    result = TreeVectorized(market=market, option=option, nb_steps=200, prunning_value=1e-10).price_richardson()
+    assert abs(result["Price"] - closed_form) <= raw_error
+    if not result["Extrapolated"]:
+        assert result["Price"] == result["Price 2N"]
+
+def test_richardson_keeps_session_tree_consistent(start_date):
+    #Arbre réutilisé entre deux pricings (generate_and_price(tree=...)) : Richardson à un autre spot ne doit pas fausser le repricing suivant
+    market = Market(spot=100, volatility=0.2, rate=0.05)
+    option = AmericanPutOption(time_to_maturity=1, strike=100, start_date=start_date)
+    tree = Tree(market=market, option=option, nb_steps=200, prunning_value=1e-10)
+    first = tree.reprice()
+    market.spot = 110
+    tree.price_richardson()
+    assert tree.smoothing is False
+    market.spot = 100
+    assert tree.reprice() == pytest.approx(first, abs=1e-12)
+    assert first == pytest.approx(fresh_price(Market(spot=100, volatility=0.2, rate=0.05), option), abs=1e-12)
+
+def test_refresh_tracks_in_place_dividend_change(start_date):
+    dividend = Dividend(date=datetime(2024, 6, 1), amount=2)
+    market = Market(spot=100, volatility=0.2, rate=0.05, dividends=[dividend])
+    option = AmericanPutOption(time_to_maturity=1, strike=100, start_date=start_date)
+    tree = Tree(market=market, option=option, nb_steps=200, prunning_value=1e-10)
+    tree.reprice()
+    dividend.amount = 4
+    assert tree.refresh_tree()
+    expected = fresh_price(Market(spot=100, volatility=0.2, rate=0.05, dividends=[Dividend(date=datetime(2024, 6, 1), amount=4)]), option)
+    assert tree.price() == pytest.approx(expected, abs=1e-12)
+
+def test_payoff_change_does_not_regenerate(market, start_date):
+    option = EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date)
+    tree = Tree(market=market, option=option, nb_steps=200, prunning_value=1e-10)
+    tree.reprice()
+    option.strike = 110
+    assert not tree.refresh_tree()
+    assert tree.price() == pytest.approx(fresh_price(market, option), abs=1e-12)
+
+@pytest.mark.parametrize("engine", [Tree, TreeVectorized, TreeMemoryAlloc])
+@pytest.mark.parametrize("option_class", [EuropeanCallOption, AmericanPutOption])
+def test_price_tolerance_pruning(market, start_date, engine, option_class):
+    option = option_class(time_to_maturity=1, strike=100, start_date=start_date)
+    reference = engine(market=market, option=option, nb_steps=300, prunning_value=1e-12)
+    reference.generate_tree()
+    tree = engine(market=market, option=option, nb_steps=300, prunning_value=1e-12, price_tolerance=1e-4)
+    tree.generate_tree()
+    assert tree.price() == pytest.approx(reference.price(), abs=1e-4)
+    assert sum(tree.column_sizes()) < sum(reference.column_sizes())
@@ -0,0 +1,52 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from PythonFiles.market import Market
+from PythonFiles.options import EuropeanCallOption, AmericanPutOption, BermudeanCallOption, DigitalPutOption, BarrierCallOption
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.treeMemoryAlloc import TreeMemoryAlloc
+from PythonFiles.benchmark import memory_per_node
+
+@pytest.mark.parametrize("option_class", [EuropeanCallOption, AmericanPutOption])
+def test_float32_storage_does_not_drift(market, start_date, option_class):
+    option = option_class(time_to_maturity=1, strike=100, start_date=start_date)
+    prices = {}
+    for precision in ("float64", "float32"):
+        tree = TreeVectorized(market=market, option=option, nb_steps=2000, prunning_value=1e-10, precision=precision)
+        tree.generate_tree()
+        prices[precision] = (tree.price(), tree.column_sizes())
+    assert abs(prices["float32"][0] - prices["float64"][0]) < 1e-5
+    assert prices["float32"][1] == prices["float64"][1]
+
+def test_columns_memory_per_node(market, start_date):
+    option = AmericanPutOption(time_to_maturity=1, strike=100, start_date=start_date)
+    bytes_per_node = memory_per_node(market, option, 400, 1e-10).set_index("Representation")["Bytes per node"]
+    #Colonnes régulières : seuls les prix sont gardés par noeud après la génération
+    assert bytes_per_node["Columns float64"] < bytes_per_node["Node (dataclass)"] / 3
+    assert bytes_per_node["Columns float32"] < 0.7 * bytes_per_node["Columns float64"]
+
+def test_memory_alloc_rejects_float32(market, start_date):
+    tree = TreeMemoryAlloc(market=market, option=EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date), nb_steps=10,
+                           prunning_value=1e-10, precision="float32")
+    with pytest.raises(ValueError):
+        tree.generate_tree()
+
+def test_price_batch_matches_single_prices(start_date):
+    market = Market(spot=100, volatility=0.2, rate=0.05, dividende=2, div_date=datetime(2024, 5, 1))
+    options = [AmericanPutOption(time_to_maturity=1, strike=strike, start_date=start_date) for strike in (90, 100, 110)]
+    options += [EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date), DigitalPutOption(time_to_maturity=1, strike=95, start_date=start_date, coupon=2),
+                BermudeanCallOption(time_to_maturity=1, strike=100, start_date=start_date, exercise_dates=[datetime(2024, 4, 1), datetime(2024, 9, 1)])]
+    tree = TreeVectorized(market=market, option=options[0], nb_steps=200, prunning_value=1e-10)
+    tree.generate_tree()
+    singles = []
+    for option in options:
+        single = TreeVectorized(market=market, option=option, nb_steps=200, prunning_value=1e-10)
+        single.generate_tree()
+        singles.append(single.price())
+    np.testing.assert_allclose(tree.price_batch(options), singles, rtol=0, atol=1e-12)
+
+def test_price_batch_rejects_barriers(market, start_date):
+    tree = TreeVectorized(market=market, option=EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date), nb_steps=10, prunning_value=1e-10)
+    tree.generate_tree()
+    with pytest.raises(ValueError):
+        tree.price_batch([BarrierCallOption(time_to_maturity=1, strike=100, start_date=start_date, barrier=120)])
@@ -0,0 +1,44 @@
+from datetime import datetime
+import numpy as np
+import pytest
+#utils importe la visualisation de l'arbre
+for module in ("matplotlib", "seaborn", "networkx"):
+    pytest.importorskip(module)
+from PythonFiles.market import Market, Dividend
+from PythonFiles.options import (EuropeanCallOption, EuropeanPutOption, AmericanPutOption, DigitalCallOption, DigitalPutOption,
+                                 BarrierCallOption)
+from PythonFiles.treeVectorized import TreeVectorized
+from PythonFiles.utils import calculate_prices_range, closed_form_prices
+
+def test_calculate_prices_range_follows_steps(market, start_date):
+    option = AmericanPutOption(strike=100, time_to_maturity=1, start_date=start_date)
+    steps = [50, 400, 100]
+    prices, times = calculate_prices_range(steps, market, option, engine=TreeVectorized, max_workers=2)
+    sequential, _ = calculate_prices_range(steps, market, option, engine=TreeVectorized, max_workers=1)
+    expected = []
+    for nb_steps in steps:
+        tree = TreeVectorized(market=market, option=option, nb_steps=nb_steps, prunning_value=1e-10)
+        tree.generate_tree()
+        expected.append(tree.price())
+    np.testing.assert_array_equal(prices, expected)
+    np.testing.assert_array_equal(sequential, expected)
+    assert len(times) == len(steps)
+
+def test_closed_form_prices_match_single_formulas(market, start_date):
+    options = [EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date), EuropeanPutOption(time_to_maturity=0.5, strike=95, start_date=start_date),
+               DigitalCallOption(time_to_maturity=1, strike=100, start_date=start_date), DigitalPutOption(time_to_maturity=1, strike=110, start_date=start_date, coupon=3),
+               BarrierCallOption(time_to_maturity=1, strike=100, start_date=start_date, barrier=120)]
+    prices = closed_form_prices(market, options)
+    np.testing.assert_allclose(prices, [option.compute_price(market) for option in options], rtol=0, atol=1e-12)
+    assert prices[2] == pytest.approx(0.5323248, abs=1e-7)
+
+def test_closed_form_prices_with_dividend_schedule(start_date):
+    market = Market(spot=100, volatility=0.2, rate=0.05, dividends=[Dividend(date=datetime(2024, 6, 1), amount=3)])
+    option = EuropeanCallOption(time_to_maturity=1, strike=100, start_date=start_date)
+    tree = TreeVectorized(market=market, option=option, nb_steps=500, prunning_value=1e-10, smoothing=True)
+    tree.generate_tree()
+    assert closed_form_prices(market, [option])[0] == pytest.approx(tree.price(), abs=0.05)
+
+def test_closed_form_prices_reject_early_exercise(market, start_date):
+    with pytest.raises(ValueError):
+        closed_form_prices(market, [AmericanPutOption(time_to_maturity=1, strike=100, start_date=start_date)])